@@ -0,0 +1,325 @@
+"""
+    Benchmark suite for the grammar engines
+
+    Runs the main.py grammars and generated families of growing length n and rule count |P| on every engine,
+    records wall time (best of repeats), peak traced memory and the empirical scaling exponents
+    (slope of log time against log n, and against log |P|), and writes them as JSON.
+    With a saved baseline, times slower than tolerance x baseline and exponents grown by more than 0.5 are reported as regressions.
+
+    python benchmark.py                      run and write benchmark_results.json
+    python benchmark.py --save-baseline      also store the run as benchmark_baseline.json
+    python benchmark.py --quick              smaller sizes, for a quick check
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from grammars import Context_Free_Grammar, Growing_Context_Sensitive_Grammar, Recursive_Grammar, Regular_Grammar, Prefilter, UNKNOWN
+
+
+def dyck_grammar(k):
+    # S → a_i S b_i | c, k kinds of brackets around a single c
+    letters = "abdefghijklmnopqrstuvwxyz0123456789"
+    pairs = [(letters[2 * i], letters[2 * i + 1]) for i in range(k)]
+    rules = {"S": [a + "S" + b for a, b in pairs] + ["c"]}
+    return {"S"}, {c for pair in pairs for c in pair} | {"c"}, "S", rules, pairs
+
+
+def dyck_inputs(k, n, rng):
+    _, _, _, _, pairs = dyck_grammar(k)
+    depth = (n - 1) // 2
+    chosen = [rng.choice(pairs) for _ in range(depth)]
+    member = "".join(a for a, _ in chosen) + "c" + "".join(b for _, b in reversed(chosen))
+    # the c swapped with its left neighbour keeps the alphabet, the ends and the counts, so no pre-filter can reject it
+    non_member = member[:depth - 1] + "c" + member[depth - 1] + member[depth + 1:] if depth > 0 else member + "c"
+    return member, non_member
+
+
+def gcsg_grammar(k):
+    # the main.py growing context-sensitive grammar a^m b^m c, with k - 1 more letters taking the place of b
+    letters = "bdefghijklmnopqrstuvwxyz"[:k]
+    rules = {"S": [], "Ac": ["aaAcc", "aac"], "cA": ["ccAa"]}
+    for d in letters:
+        rules["S"].append("aA" + d + "c")
+        rules["A" + d] = ["aA" + d + d, "a" + d + d]
+        rules[d + "A"] = [d + d + "Aa"]
+    return {"S", "A", "B"}, set(letters) | {"a", "c"}, "S", rules, letters
+
+
+def gcsg_inputs(k, n, rng):
+    _, _, _, _, letters = gcsg_grammar(k)
+    m = max((n - 1) // 2, 2)
+    d = rng.choice(letters)
+    return "a" * m + d * m + "c", "a" * m + d * (m + 1) + "c"
+
+
+def recursive_grammar():
+    # main.py grammar_4, the search is bounded by max_steps
+    return {"S", "A"}, {"a", "b"}, "S", {"S": ["aS", "Sb", "A"], "aAb": ["b"]}
+
+
+def recursive_inputs(n, rng):
+    return "a" * (n - 1) + "b", "b" + "a" * (n - 1)
+
+
+def regular_grammar(k):
+    # strings of even length over k letters
+    letters = "abcdefghijklmnopqrstuvwxyz"[:k]
+    return {"S", "A"}, set(letters), "S", {"S": [t + "A" for t in letters] + [""], "A": [t + "S" for t in letters]}, letters
+
+
+def regular_inputs(k, n, rng):
+    _, _, _, _, letters = regular_grammar(k)
+    member = "".join(rng.choice(letters) for _ in range(n - n % 2))
+    return member, member + rng.choice(letters)
+
+
+def with_prefilter(grammar, spec):
+    # as build_grammar would set it up
+    grammar.prefilter = Prefilter.from_grammar(*spec[:4])
+    return grammar
+
+
+# engine name -> (factory from the grammar tuple, largest n it is run on)
+CONTEXT_FREE_ENGINES = {
+    "cyk_vectorized": (lambda g: with_prefilter(Context_Free_Grammar(*g[:4]), g), None),
+    "cyk_packed": (lambda g: with_prefilter(Context_Free_Grammar(*g[:4], chart="packed"), g), None),
+    "cyk_naive": (lambda g: with_prefilter(Context_Free_Grammar(*g[:4], engine="naive"), g), 33),
+    "cyk_generated": (lambda g: with_prefilter(Context_Free_Grammar(*g[:4], engine="generated"), g), 129),
+    "earley": (lambda g: with_prefilter(Context_Free_Grammar(*g[:4], engine="earley"), g), None),
+}
+GROWING_CONTEXT_SENSITIVE_ENGINES = {
+    "gcyk_pass": (lambda g: with_prefilter(Growing_Context_Sensitive_Grammar(*g[:4]), g), None),
+    "gcyk_worklist": (lambda g: with_prefilter(Growing_Context_Sensitive_Grammar(*g[:4], engine="worklist"), g), None),
+    "gcyk_generated": (lambda g: with_prefilter(Growing_Context_Sensitive_Grammar(*g[:4], engine="generated"), g), None),
+    "gcyk_packed": (lambda g: with_prefilter(Growing_Context_Sensitive_Grammar(*g[:4], chart="packed"), g), 33),
+}
+RECURSIVE_ENGINES = {
+    "search_aho_corasick": (lambda g: with_prefilter(Recursive_Grammar(*g[:4], max_steps=20000), g), None),
+    "search_naive": (lambda g: with_prefilter(Recursive_Grammar(*g[:4], engine="naive", max_steps=20000), g), None),
+    "search_bfs": (lambda g: with_prefilter(Recursive_Grammar(*g[:4], strategy="bfs", max_steps=20000), g), None),
+}
+REGULAR_ENGINES = {
+    "dfa": (lambda g: Regular_Grammar(*g[:4]), None),
+}
+
+
+def families(quick):
+    # (family, engines, axis, k, n, grammar builder, inputs builder); axis is what varies within a series
+    lengths = {
+        "dyck": [9, 17, 33, 65] if quick else [9, 17, 33, 65, 129, 257, 513],
+        "gcsg": [9, 17, 25] if quick else [9, 17, 25, 33, 49],
+        "recursive": [4, 8, 16] if quick else [4, 8, 16, 32, 64],
+        "regular": [1000, 10000] if quick else [1000, 10000, 100000, 1000000],
+    }
+    ks = [1, 2, 4] if quick else [1, 2, 4, 8, 16]
+    for n in lengths["dyck"]:
+        yield "dyck", CONTEXT_FREE_ENGINES, "n", 2, n, dyck_grammar, dyck_inputs
+    for k in ks:
+        yield "dyck", CONTEXT_FREE_ENGINES, "rules", k, 33, dyck_grammar, dyck_inputs
+    for n in lengths["gcsg"]:
+        yield "gcsg", GROWING_CONTEXT_SENSITIVE_ENGINES, "n", 1, n, gcsg_grammar, gcsg_inputs
+    for k in ks[:4]:
+        yield "gcsg", GROWING_CONTEXT_SENSITIVE_ENGINES, "rules", k, 17, gcsg_grammar, gcsg_inputs
+    for n in lengths["recursive"]:
+        yield "recursive", RECURSIVE_ENGINES, "n", 1, n, lambda k: recursive_grammar(), lambda k, n, rng: recursive_inputs(n, rng)
+    for n in lengths["regular"]:
+        yield "regular", REGULAR_ENGINES, "n", 2, n, regular_grammar, regular_inputs
+    for k in ks:
+        yield "regular", REGULAR_ENGINES, "rules", k, 10000, regular_grammar, regular_inputs
+
+
+def main_grammars():
+    # the grammars and asserts of main.py
+    return [
+        ("grammar_1", CONTEXT_FREE_ENGINES, ({"S", "A"}, {"a", "b"}, "S", {"S": ["aAb"], "A": ["aaAbb", "ab"]}),
+         [("aabb", True), ("aaaabbbb", True), ("aaabbbb", False), ("aaabbb", False)]),
+        ("grammar_2", GROWING_CONTEXT_SENSITIVE_ENGINES, ({"S", "A", "B"}, {"a", "b", "c"}, "S", {"S": ["aAbc"], "Ab": ["aAbb", "abb"], "Ac": ["aaAcc", "aac"], "bA": ["bbAa"], "cA": ["ccAa"]}),
+         [("aabbc", True), ("aaabbbc", True), ("aaaaaaccc", False)]),
+        ("grammar_3", CONTEXT_FREE_ENGINES, ({"S", "A"}, {"a", "b"}, "S", {"S": ["aSA", "b"], "A": ["b"]}),
+         [("abb", True), ("aabbb", True), ("bb", False)]),
+        ("grammar_4", RECURSIVE_ENGINES, recursive_grammar(),
+         [("b", True), ("ab", True), ("aaab", True), ("bbbb", True)]),
+        ("grammar_5", GROWING_CONTEXT_SENSITIVE_ENGINES, ({"S", "A", "B"}, {"a", "b", "c"}, "S", {"S": ["A"], "A": ["aABb", "aa"], "B": ["bABc", "bb"], "aAB": ["aBBB"], "bAB": ["bBBB"]}),
+         [("aa", True), ("aaabbb", True), ("aabbbbbbbbbbbbbbcb", True), ("ccccaaaaabbbbbb", False)]),
+    ]
+
+
+def rule_count(grammar):
+    if hasattr(grammar, "size_report"):
+        return grammar.size_report["after"]["rules"]
+    return sum(len(productions) for productions in grammar.rules.values())
+
+
+def measure(grammar, x, repeats, budget, memory):
+    # best wall time of up to repeats runs within budget seconds, then the peak traced memory of one more run
+    best = math.inf
+    spent = 0.0
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = grammar.match(x)
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        if spent > budget:
+            break
+    peak = None
+    if memory:
+        tracemalloc.start()
+        grammar.match(x)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def result_name(result):
+    if result is UNKNOWN:
+        return "UNKNOWN"
+    return str(bool(result))
+
+
+def run(quick=False, repeats=3, budget=2.0, memory=True, only=None, log=print):
+    rng = random.Random(0)
+    results = []
+
+    def record(family, engine, axis, k, n, rules, member, expected, result, seconds, peak):
+        entry = {
+            "family": family, "engine": engine, "axis": axis, "k": k, "n": n, "rules": rules,
+            "member": member, "result": result_name(result), "seconds": seconds, "peak_bytes": peak,
+        }
+        # a wrong answer is a bug, not a timing, it is kept in the results and reported
+        entry["correct"] = expected is None or result_name(result) == result_name(expected) or result is UNKNOWN
+        results.append(entry)
+        log("{:<10} {:<20} {:<5} k={:<3} n={:<8} |P|={:<5} {:<7} {:<7} {:>10.6f}s {:>12} B".format(
+            family, engine, axis, k, n, rules, "member" if member else "non", entry["result"], seconds, peak if peak is not None else "-"))
+
+    for name, engines, spec, cases in main_grammars():
+        if only is not None and only not in name:
+            continue
+        for engine, (factory, max_n) in engines.items():
+            grammar = factory(spec)
+            for x, expected in cases:
+                result, seconds, peak = measure(grammar, x, repeats, budget, memory)
+                record(name, engine, "main", 0, len(x), rule_count(grammar), expected, expected, result, seconds, peak)
+
+    grammars = {}
+    for family, engines, axis, k, n, make_grammar, make_inputs in families(quick):
+        if only is not None and only not in family:
+            continue
+        spec = make_grammar(k)
+        member, non_member = make_inputs(k, n, rng)
+        for engine, (factory, max_n) in engines.items():
+            if max_n is not None and n > max_n:
+                continue
+            key = (family, engine, k)
+            if key not in grammars:
+                grammars[key] = factory(spec)
+            grammar = grammars[key]
+            for x, is_member in ((member, True), (non_member, False)):
+                # the recursive search may run out of steps, its answers are not checked
+                expected = is_member if family != "recursive" else None
+                result, seconds, peak = measure(grammar, x, repeats, budget, memory)
+                record(family, engine, axis, k, len(x), rule_count(grammar), is_member, expected, result, seconds, peak)
+
+    return results
+
+
+def scaling_exponents(results):
+    # slope of log(seconds) over log(n) or log(|P|) per family, engine and membership, times under 0.1 ms are noise
+    series = {}
+    for r in results:
+        if r["axis"] not in ("n", "rules") or r["seconds"] < 1e-4:
+            continue
+        x = r["n"] if r["axis"] == "n" else r["rules"]
+        key = "{}/{}/{}/{}".format(r["family"], r["engine"], r["axis"], "member" if r["member"] else "non")
+        series.setdefault(key, []).append((x, r["seconds"]))
+    exponents = {}
+    for key, points in series.items():
+        xs = np.log([x for x, _ in points])
+        if len(points) < 3 or np.ptp(xs) == 0:
+            continue
+        exponents[key] = float(np.polyfit(xs, np.log([s for _, s in points]), 1)[0])
+    return exponents
+
+
+def compare(report, baseline, tolerance):
+    # returns the regressions as readable lines
+    regressions = []
+    key = lambda r: (r["family"], r["engine"], r["axis"], r["k"], r["n"], r["member"])
+    before = {key(r): r for r in baseline["results"]}
+    for r in report["results"]:
+        b = before.get(key(r))
+        if b is None:
+            continue
+        # below a millisecond the timer noise dominates
+        if r["seconds"] > tolerance * b["seconds"] and r["seconds"] - b["seconds"] > 1e-3:
+            regressions.append("{} {} {} k={} n={}: {:.6f}s, baseline {:.6f}s".format(r["family"], r["engine"], "member" if r["member"] else "non", r["k"], r["n"], r["seconds"], b["seconds"]))
+    for name, exponent in report["exponents"].items():
+        old = baseline["exponents"].get(name)
+        if old is not None and exponent > old + 0.5:
+            regressions.append("{}: scaling exponent {:.2f}, baseline {:.2f}".format(name, exponent, old))
+    return regressions
+
+
+def wrong_results(report):
+    return ["{} {} k={} n={}: wrong result {}".format(r["family"], r["engine"], r["k"], r["n"], r["result"]) for r in report["results"] if not r["correct"]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the grammar engines")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes")
+    parser.add_argument("--only", help="run the families and main.py grammars whose name contains this")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced memory runs")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="slowdown factor reported as a regression")
+    args = parser.parse_args()
+
+    results = run(quick=args.quick, repeats=args.repeats, memory=not args.no_memory, only=args.only)
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": args.quick,
+        },
+        "results": results,
+        "exponents": scaling_exponents(results),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+    print("scaling exponents")
+    for name, exponent in sorted(report["exponents"].items()):
+        print("  {:<50} {:.2f}".format(name, exponent))
+
+    regressions = wrong_results(report)
+    for line in regressions:
+        print("  " + line)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=1)
+        print("baseline saved to", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            slower = compare(report, json.load(f), args.tolerance)
+        print("{} regressions against {}".format(len(slower), args.baseline))
+        for line in slower:
+            print("  " + line)
+        regressions += slower
+    else:
+        print("no baseline at {}, run with --save-baseline to create one".format(args.baseline))
+    sys.exit(1 if regressions else 0)
@@ -1,16 +1,74 @@
-from .recursive import Recursive_Grammar
+import os
+import sys
+
+from .recursive import Recursive_Grammar, UNKNOWN
 from .growing_cs import Growing_Context_Sensitive_Grammar
 from .context_free import Context_Free_Grammar
+from .regular import Regular_Grammar
+from .compiled import Compiled_Grammar, grammar_hash
+from .batch import Batch_Stats
+from .prefilter import Prefilter
+from .stats import Match_Stats, Stats_Collector, JSON_Lines_Exporter
+from .service import Match_Service
+
+
+GRAMMAR_KINDS = {
+    "regular": (Regular_Grammar, "Regular Grammar"),
+    "context_free": (Context_Free_Grammar, "Context Free Grammar"),
+    "growing_context_sensitive": (Growing_Context_Sensitive_Grammar, "Growing Context Sensitive Grammar"),
+    "recursive": (Recursive_Grammar, "Recursive Grammar"),
+}
+
 
+def load_grammar(path):
+    compiled = Compiled_Grammar.load(path)
+    grammar_class, _ = GRAMMAR_KINDS[compiled.kind]
+    return grammar_class.from_compiled(compiled)
 
 
-def build_grammar(non_terminal_set, terminal_set, start_symbol, rules):
-    if Context_Free_Grammar.check_grammar(non_terminal_set, terminal_set, start_symbol, rules):
-        print("Context Free Grammar")
-        return Context_Free_Grammar(non_terminal_set, terminal_set, start_symbol, rules)
-    if Growing_Context_Sensitive_Grammar.check_grammar(non_terminal_set, terminal_set, start_symbol, rules):
+def build_grammar(non_terminal_set, terminal_set, start_symbol, rules, cache_dir=None, context_free_engine=None):
+    # the kind of grammar built is reported on stderr, stdout is left to the caller
+    # with a cache_dir, the compiled grammar is stored under the hash of the input grammar and reused by later builds
+    # context_free_engine picks CYK ("vectorized", "naive", "generated") or "earley" for context-free grammars,
+    # by default regular grammars get a DFA and the others vectorized CYK, an engine asked for is never replaced by the DFA
+    if context_free_engine is not None and Regular_Grammar.check_grammar(non_terminal_set, terminal_set, start_symbol, rules):
+        # the cache holds the DFA of a regular grammar, the CYK grammar is built without it
+        print("Context Free Grammar", file=sys.stderr)
+        grammar = Context_Free_Grammar(non_terminal_set, terminal_set, start_symbol, rules, engine=context_free_engine)
+        grammar.prefilter = Prefilter.from_grammar(non_terminal_set, terminal_set, start_symbol, rules)
+        return grammar
+    context_free_engine = context_free_engine if context_free_engine is not None else "vectorized"
+
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, grammar_hash(non_terminal_set, terminal_set, start_symbol, rules) + ".gcsg")
+        if os.path.exists(path):
+            compiled = Compiled_Grammar.load(path)
+            grammar_class, name = GRAMMAR_KINDS[compiled.kind]
+            print(name, file=sys.stderr)
+            if grammar_class is Context_Free_Grammar:
+                return grammar_class.from_compiled(compiled, engine=context_free_engine)
+            return grammar_class.from_compiled(compiled)
+
+    if Regular_Grammar.check_grammar(non_terminal_set, terminal_set, start_symbol, rules):
+        # matching is linear
+        print("Regular Grammar", file=sys.stderr)
+        grammar = Regular_Grammar(non_terminal_set, terminal_set, start_symbol, rules)
+    elif Context_Free_Grammar.check_grammar(non_terminal_set, terminal_set, start_symbol, rules):
+        print("Context Free Grammar", file=sys.stderr)
+        grammar = Context_Free_Grammar(non_terminal_set, terminal_set, start_symbol, rules, engine=context_free_engine)
+    elif Growing_Context_Sensitive_Grammar.check_grammar(non_terminal_set, terminal_set, start_symbol, rules):
         # matching is polynomial
-        print("Growing Context Sensitive Grammar")
-        return Growing_Context_Sensitive_Grammar(non_terminal_set, terminal_set, start_symbol, rules)
-    print("Recursive Grammar")
-    return Recursive_Grammar(non_terminal_set, terminal_set, start_symbol, rules)
+        print("Growing Context Sensitive Grammar", file=sys.stderr)
+        grammar = Growing_Context_Sensitive_Grammar(non_terminal_set, terminal_set, start_symbol, rules)
+    else:
+        print("Recursive Grammar", file=sys.stderr)
+        grammar = Recursive_Grammar(non_terminal_set, terminal_set, start_symbol, rules)
+
+    # the DFA of a regular grammar already rejects in one scan
+    if not isinstance(grammar, Regular_Grammar):
+        grammar.prefilter = Prefilter.from_grammar(non_terminal_set, terminal_set, start_symbol, rules)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        grammar.compile().save(path)
+    return grammar
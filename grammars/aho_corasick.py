@@ -0,0 +1,80 @@
+"""
+    Aho–Corasick automaton over the right-hand sides of a grammar
+
+    One scan of a sentential form gives the automaton state after every position, and the outputs of a state are
+    every right-hand side ending there. A reduction only changes a window of the form, so the automaton only steps
+    over that window again: the states before it are the parent's, and the scan stops once it is back in the parent's
+    state past the window, the remaining states are the parent's shifted. The reduced form and its states are still
+    new copies, O(n) each, forms being the keys of the visited set.
+"""
+
+from collections import deque
+
+
+class Aho_Corasick:
+
+    def __init__(self, patterns):
+        # trie, goto[state][symbol] -> state
+        self.goto = [{}]
+        depth = [0]
+        terminal_of = [None]
+        for pattern in patterns:
+            if len(pattern) == 0:
+                continue
+            state = 0
+            for c in pattern:
+                if c not in self.goto[state]:
+                    self.goto.append({})
+                    depth.append(depth[state] + 1)
+                    terminal_of.append(None)
+                    self.goto[state][c] = len(self.goto) - 1
+                state = self.goto[state][c]
+            terminal_of[state] = pattern
+
+        # failure links in breadth first order, outputs merged along them
+        # outputs are sorted longest first, that is leftmost start first for a fixed end
+        self.fail = [0] * len(self.goto)
+        self.outputs = [()] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            own = (terminal_of[state],) if terminal_of[state] is not None else ()
+            self.outputs[state] = own + self.outputs[self.fail[state]]
+            for c, child in self.goto[state].items():
+                f = self.fail[state]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(c, 0)
+                queue.append(child)
+        self.max_depth = max(depth)
+
+
+    def step(self, state, c):
+        while state and c not in self.goto[state]:
+            state = self.fail[state]
+        return self.goto[state].get(c, 0)
+
+
+    def scan(self, x, state=0):
+        # automaton state after each symbol of x
+        states = []
+        for c in x:
+            state = self.step(state, c)
+            states.append(state)
+        return states
+
+
+    def reduce(self, x, states, j, i, r):
+        # replace x[j:i] by r, returns the new form and its states, copying the states of x outside the changed window
+        y = x[:j] + r + x[i:]
+        delta = len(r) - (i - j)
+        y_states = states[:j]
+        state = states[j - 1] if j > 0 else 0
+        for t in range(j, len(y)):
+            state = self.step(state, y[t])
+            y_states.append(state)
+            # past the replacement the automaton rejoins the parent, everything after is shifted
+            if t >= j + len(r) and state == states[t - delta]:
+                y_states.extend(states[t - delta + 1:])
+                break
+        return y, y_states
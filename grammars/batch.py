@@ -0,0 +1,154 @@
+"""
+    Batch matching: check many strings against one grammar
+
+    Inputs are read in windows and grouped by length, so every string of a bucket reuses the same table.
+    With workers > 1, the compiled grammar is written once to a temporary file and every worker process maps it at startup,
+    tasks only carry the strings.
+"""
+
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+
+from .chart import Chart
+
+
+class Batch_Stats:
+
+    def __init__(self):
+        self.count = 0
+        self.matched = 0
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+
+
+    def update(self, results):
+        self.count += len(results)
+        self.matched += sum(1 for r in results if r)
+        self.elapsed = time.perf_counter() - self.start
+
+
+    @property
+    def throughput(self):
+        # strings per second
+        return self.count / self.elapsed if self.elapsed > 0 else 0.0
+
+
+    def __repr__(self):
+        return "Batch_Stats(count={}, matched={}, elapsed={:.3f}s, throughput={:.1f}/s)".format(self.count, self.matched, self.elapsed, self.throughput)
+
+
+# engines whose match fills a table passed in by the caller, the others keep their own
+TABLE_ENGINES = ("vectorized", "pass", "worklist")
+
+
+def match_bucket(grammar, strings):
+    # all strings have the same length, allocate the table once and reuse it
+    if len(strings) == 0:
+        return []
+    if hasattr(grammar, "match_batch"):
+        return grammar.match_batch(strings).tolist()
+    if hasattr(grammar, "allocate_table") and grammar.engine in TABLE_ENGINES:
+        table = grammar.allocate_table(len(strings[0]))
+        try:
+            return [grammar.match(x, table=table) for x in strings]
+        finally:
+            # a packed or mmap chart holds a temporary file
+            if isinstance(table, Chart):
+                table.close()
+    return [grammar.match(x) for x in strings]
+
+
+def bucket_by_length(window, chunk_size):
+    # window is a list of (index, string), returns chunks of the same length of at most chunk_size
+    buckets = {}
+    for index, x in window:
+        buckets.setdefault(len(x), []).append((index, x))
+    chunks = []
+    for length in sorted(buckets):
+        bucket = buckets[length]
+        for c in range(0, len(bucket), chunk_size):
+            chunks.append(bucket[c:c + chunk_size])
+    return chunks
+
+
+# matching options that are not part of the compiled grammar, copied onto the grammar in every worker
+WORKER_OPTIONS = ("engine", "chart", "chart_dir", "strategy", "max_steps", "max_seconds", "max_memory", "max_visited")
+
+_worker_grammar = None
+
+
+def _init_worker(path, options):
+    global _worker_grammar
+    from . import load_grammar
+    _worker_grammar = load_grammar(path)
+    for name, value in options.items():
+        setattr(_worker_grammar, name, value)
+
+
+def _match_chunk(chunk):
+    indices = [index for index, _ in chunk]
+    return indices, match_bucket(_worker_grammar, [x for _, x in chunk])
+
+
+def match_many(grammar, iterable, workers=1, ordered=True, chunk_size=256, window=None, stats=None):
+    # ordered=True yields results in input order, otherwise (index, result) pairs as soon as their chunk completes
+    # stats, if given a Batch_Stats, is updated as results come in
+    if window is None:
+        window = chunk_size * max(workers, 1) * 4
+    items = enumerate(iterable)
+
+    if workers is None or workers <= 1:
+        while True:
+            chunks = bucket_by_length(list(islice(items, window)), chunk_size)
+            if len(chunks) == 0:
+                break
+            window_results = []
+            for chunk in chunks:
+                results = match_bucket(grammar, [x for _, x in chunk])
+                if stats is not None:
+                    stats.update(results)
+                window_results.extend(zip([index for index, _ in chunk], results))
+                if not ordered:
+                    yield from window_results
+                    window_results = []
+            if ordered:
+                window_results.sort()
+                yield from (r for _, r in window_results)
+        return
+
+    fd, path = tempfile.mkstemp(suffix=".gcsg")
+    os.close(fd)
+    try:
+        grammar.compile().save(path)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(path, {name: getattr(grammar, name) for name in WORKER_OPTIONS if hasattr(grammar, name)})) as pool:
+            # keep at most one window of chunks in flight, so memory stays bounded on endless inputs
+            pending = set()
+            buffered = {}
+            next_index = 0
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < 2 * workers and len(buffered) < window:
+                    chunks = bucket_by_length(list(islice(items, window)), chunk_size)
+                    if len(chunks) == 0:
+                        exhausted = True
+                        break
+                    pending.update(pool.submit(_match_chunk, chunk) for chunk in chunks)
+                if len(pending) == 0:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    indices, results = future.result()
+                    if stats is not None:
+                        stats.update(results)
+                    if ordered:
+                        buffered.update(zip(indices, results))
+                    else:
+                        yield from zip(indices, results)
+                while next_index in buffered:
+                    yield buffered.pop(next_index)
+                    next_index += 1
+    finally:
+        os.remove(path)
@@ -0,0 +1,126 @@
+"""
+    Compact CYK chart: only the upper triangle, every cell is a bitset of nonterminals packed into uint64 words
+
+    Cells are addressed by (start, length). They are stored by end position, cell (i, j) with i <= j at
+    j (j + 1) / 2 + i, so growing the chart for a longer input only appends. The store is an in-memory array,
+    or a file mapped with mmap for inputs too long for memory.
+    Indexing with (i, j, nt), i the start and j the inclusive end, mirrors the dense (L, L, NT) table.
+"""
+
+import tempfile
+
+import numpy as np
+
+
+def cell_count(L):
+    return L * (L + 1) // 2
+
+
+class Chart:
+
+    def __init__(self, L, NT, mmap_dir=None):
+        self.L = L
+        self.NT = NT
+        self.words = max(1, (NT + 63) // 64)
+        self._file = None
+        if mmap_dir is not None:
+            # anonymous file, removed from the directory at once and freed when the chart is closed
+            self._file = tempfile.TemporaryFile(dir=mmap_dir)
+        self.data = self._allocate(L)
+
+
+    def _allocate(self, L):
+        shape = (max(cell_count(L), 1), self.words)
+        if self._file is None:
+            return np.zeros(shape, dtype=np.uint64)
+        self._file.truncate(shape[0] * shape[1] * 8)
+        return np.memmap(self._file, dtype=np.uint64, mode="r+", shape=shape)
+
+
+    def resize(self, L):
+        # cells are stored by end position, a longer chart keeps every cell at its offset
+        if L <= self.L:
+            return
+        if self._file is None:
+            data = self._allocate(L)
+            data[:len(self.data)] = self.data
+            self.data = data
+        else:
+            self.data.flush()
+            self.data = self._allocate(L)
+        self.L = L
+
+
+    def close(self):
+        if self._file is not None:
+            del self.data
+            self._file.close()
+            self._file = None
+
+
+    def fill(self, value):
+        # only clearing is supported, as for reusing a dense table
+        if value:
+            raise ValueError("a chart can only be filled with False")
+        self.data.fill(0)
+
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+    def count(self):
+        # number of (cell, nonterminal) entries set, padding bits are never set
+        return int(np.unpackbits(np.ascontiguousarray(self.data).view(np.uint8)).sum(dtype=np.int64))
+
+
+    def index(self, start, length):
+        end = start + length - 1
+        return end * (end + 1) // 2 + start
+
+
+    def __getitem__(self, key):
+        i, j, nt = key
+        return (int(self.data[j * (j + 1) // 2 + i, nt >> 6]) >> (nt & 63)) & 1 == 1
+
+
+    def __setitem__(self, key, value):
+        i, j, nt = key
+        cell = j * (j + 1) // 2 + i
+        bit = np.uint64(1 << (nt & 63))
+        if value:
+            self.data[cell, nt >> 6] |= bit
+        else:
+            self.data[cell, nt >> 6] &= ~bit
+
+
+    def nonterminals(self, start, length):
+        # ids of the nonterminals of one cell
+        return np.nonzero(self.unpack(self.data[self.index(start, length)][None, :])[0])[0]
+
+
+    def unpack(self, words):
+        # (..., W) words to (..., NT) booleans
+        bits = np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1, bitorder="little")
+        return bits[..., :self.NT].astype(bool)
+
+
+    def pack(self, bools):
+        # (..., NT) booleans to (..., W) words
+        padded = np.zeros(bools.shape[:-1] + (self.words * 64,), dtype=bool)
+        padded[..., :self.NT] = bools
+        return np.packbits(padded, axis=-1, bitorder="little").view(np.uint64)
+
+
+    def cells(self, length, first=0, last=None):
+        # (n, NT) booleans of the cells of one length, for starts first .. last - 1
+        last = self.L - length + 1 if last is None else last
+        starts = np.arange(first, last)
+        return self.unpack(self.data[self.index(starts, length)])
+
+
+    def set_cells(self, length, first, bools):
+        # OR (n, NT) booleans into the cells of one length starting at first
+        starts = np.arange(first, first + len(bools))
+        self.data[self.index(starts, length)] |= self.pack(bools)
@@ -0,0 +1,262 @@
+"""
+    Grammar-specialized recognizers, generated as Python source and compiled with exec
+
+    Every rule is unrolled into straight-line code, nonterminals become bit masks written as integer constants,
+    and the chart is a list of lists of ints, so the hot loops do no dict lookups, no set membership tests and no tuple unpacking.
+    The source is made from the rules of a grammar when it is first used and only embeds symbols as literals,
+    a compiled grammar file never holds code, so loading one from a cache directory does not exec its contents.
+
+    Context free: CYK over the CNF rules, the rules of one left symbol are tested together.
+    Growing context sensitive: the single pass engine, rules are grouped by the terminal their center starts with,
+    contexts and centers made of terminals are string comparisons, the others a dynamic program over end positions as in fit.
+"""
+
+# first line of every generated source
+CODEGEN_VERSION = 1
+HEADER = "# generated by grammars.codegen {}".format(CODEGEN_VERSION)
+
+
+def load_recognizer(source, **namespace):
+    # exec the generated source, namespace holds the helpers it calls, returns its recognize(x) function
+    namespace = dict(namespace)
+    exec(compile(source, "<generated recognizer>", "exec"), namespace)
+    return namespace["recognize"]
+
+
+class Writer:
+    # source lines with indentation
+
+    def __init__(self):
+        self.lines = [HEADER]
+        self.depth = 0
+
+    def line(self, text=""):
+        self.lines.append("    " * self.depth + text if text else "")
+
+    def indent(self):
+        self.depth += 1
+
+    def dedent(self):
+        self.depth -= 1
+
+    def source(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def bits(ids):
+    mask = 0
+    for nt in ids:
+        mask |= 1 << int(nt)
+    return mask
+
+
+def context_free_source(grammar):
+    # cells[l - 1][i] is the mask of the nonterminals deriving x[i:i + l]
+    terminals = {t: bits(ids) for t, ids in grammar._terminal_rules.items()}
+    # left symbol -> mask of lhs -> mask of right symbols
+    by_left = {}
+    for A, B, C in grammar._binary_rules.tolist():
+        right = by_left.setdefault(B, {})
+        right[C] = right.get(C, 0) | 1 << A
+    left_mask = bits(by_left)
+    right_mask = bits(C for right in by_left.values() for C in right)
+
+    w = Writer()
+    w.line("TERMINALS = {!r}".format(terminals))
+    w.line()
+    w.line("def recognize(x):")
+    w.indent()
+    w.line("n = len(x)")
+    w.line("if n == 0:")
+    w.line("    return {}".format(bool(grammar.has_epsilon_rule)))
+    w.line("cells = [[TERMINALS.get(c, 0) for c in x]]")
+    w.line("for l in range(2, n + 1):")
+    w.indent()
+    w.line("row = []")
+    w.line("for i in range(n - l + 1):")
+    w.indent()
+    w.line("v = 0")
+    w.line("for k in range(1, l):")
+    w.indent()
+    w.line("left = cells[k - 1][i]")
+    w.line("if left & {}:".format(left_mask))
+    w.indent()
+    w.line("right = cells[l - k - 1][i + k]")
+    w.line("if right & {}:".format(right_mask))
+    w.indent()
+    for B in sorted(by_left):
+        # right symbols that give the same lhs mask are tested at once
+        by_lhs = {}
+        for C, lhs in by_left[B].items():
+            by_lhs[lhs] = by_lhs.get(lhs, 0) | 1 << C
+        w.line("if left & {}:".format(1 << B))
+        w.indent()
+        for lhs in sorted(by_lhs):
+            w.line("if right & {}:".format(by_lhs[lhs]))
+            w.line("    v |= {}".format(lhs))
+        w.dedent()
+    w.line("pass")
+    for _ in range(3):
+        w.dedent()
+    w.line("row.append(v)")
+    w.dedent()
+    w.line("cells.append(row)")
+    w.dedent()
+    w.line("return cells[n - 1][0] & {} != 0".format(1 << grammar.nt_to_index[grammar.S]))
+    return w.source()
+
+
+def growing_context_sensitive_source(grammar):
+    # cells[i][j] is the mask of the nonterminals deriving x[i:j + 1], filled like the pass engine
+    nt_set = grammar.non_terminal_set
+    bit = lambda nt: 1 << grammar.nt_to_index[nt]
+    for p, A, B, s in grammar._rule_list:
+        if A not in grammar.nt_to_index:
+            raise ValueError("the rule {!r} does not rewrite a single nonterminal, the grammar is not growing context sensitive".format(p + A + s))
+    has_nt = lambda part: any(c in nt_set for c in part)
+    prefixes = sorted({p for p, A, B, s in grammar._rule_list if has_nt(p)})
+    suffixes = sorted({s for p, A, B, s in grammar._rule_list if has_nt(s)})
+    centers = sorted({B for p, A, B, s in grammar._rule_list if has_nt(B)})
+
+    w = Writer()
+    w.line("def recognize(x):")
+    w.indent()
+    w.line("n = len(x)")
+    w.line("if n == 0:")
+    w.line("    return {}".format(bool(grammar.has_epsilon_rule)))
+    w.line("cells = [[0] * n for _ in range(n)]")
+    # context fits that read cells are memoized per boundary as in Growing_Context_Sensitive_Grammar._fires
+    if prefixes:
+        w.line("memo_left = [{} for _ in range(n + 1)]")
+    if suffixes:
+        w.line("memo_right = [{} for _ in range(n + 1)]")
+
+    for k, p in enumerate(prefixes):
+        w.line()
+        w.line("def prefix_{}(b):".format(k))
+        w.indent()
+        w.line("memo = memo_left[b]")
+        w.line("if {} in memo:".format(k))
+        w.line("    return memo[{}]".format(k))
+        w.line("memo[{0}] = result = fit_{0}_prefix(0, b - 1)".format(k))
+        w.line("return result")
+        w.dedent()
+        write_fit(w, "fit_{}_prefix".format(k), p, nt_set, bit, kleene_prefix=True)
+    for k, s in enumerate(suffixes):
+        w.line()
+        w.line("def suffix_{}(b):".format(k))
+        w.indent()
+        w.line("memo = memo_right[b]")
+        w.line("if {} in memo:".format(k))
+        w.line("    return memo[{}]".format(k))
+        w.line("memo[{0}] = result = fit_{0}_suffix(b + 1, n - 1)".format(k))
+        w.line("return result")
+        w.dedent()
+        write_fit(w, "fit_{}_suffix".format(k), s, nt_set, bit, kleene_suffix=True)
+    for k, B in enumerate(centers):
+        write_fit(w, "center_{}".format(k), B, nt_set, bit)
+
+    w.line()
+    w.line("for i in range(n):")
+    w.indent()
+    w.line("c = x[i]")
+    terminal_rules = [(p, A, B, s) for lhs, productions in grammar.rules.items() for p, A, B, s in productions if B in grammar.terminal_set]
+    for p, A, B, s in terminal_rules:
+        w.line("if c == {!r} and terminal_context({!r}, {!r}, i, x):".format(B, p, s))
+        w.line("    cells[i][i] |= {}".format(bit(A)))
+    w.line("pass")
+    w.dedent()
+
+    # rules by the terminal their center starts with, None for a nonterminal or an empty center
+    groups = {}
+    for r in range(len(grammar._rule_list)):
+        if grammar._rule_min_length[r] > (grammar._rule_max_length[r] if grammar._rule_max_length[r] is not None else float("inf")):
+            continue
+        groups.setdefault(grammar._rule_ends[r][0], []).append(r)
+
+    w.line("for l in range(2, n + 1):")
+    w.indent()
+    w.line("for i in range(n - l + 1):")
+    w.indent()
+    w.line("j = i + l - 1")
+    w.line("a = x[i]")
+    w.line("b = x[j]")
+    first = True
+    for key in sorted(k for k in groups if k is not None):
+        w.line("{} a == {!r}:".format("if" if first else "elif", key))
+        first = False
+        w.indent()
+        for r in groups[key]:
+            write_rule(w, grammar, r, prefixes, suffixes, centers, nt_set, bit)
+        w.line("pass")
+        w.dedent()
+    for r in groups.get(None, ()):
+        write_rule(w, grammar, r, prefixes, suffixes, centers, nt_set, bit)
+    w.dedent()
+    w.dedent()
+    w.line("return cells[0][n - 1] & {} != 0".format(bit(grammar.S)))
+    return w.source()
+
+
+def write_rule(w, grammar, r, prefixes, suffixes, centers, nt_set, bit):
+    # one rule at the span (i, j) of length l, the checks cheapest first
+    p, A, B, s = grammar._rule_list[r]
+    conditions = []
+    min_length, max_length = grammar._rule_min_length[r], grammar._rule_max_length[r]
+    if max_length is not None:
+        conditions.append("l == {}".format(max_length) if max_length == min_length else "{} <= l <= {}".format(min_length, max_length))
+    elif min_length > 2:
+        conditions.append("l >= {}".format(min_length))
+    last = grammar._rule_ends[r][1]
+    if last is not None:
+        conditions.append("b == {!r}".format(last))
+    conditions.append("not cells[i][j] & {}".format(bit(A)))
+    if p:
+        conditions.append("prefix_{}(i)".format(prefixes.index(p)) if p in prefixes else "x.endswith({!r}, 0, i)".format(p))
+    if s:
+        conditions.append("suffix_{}(j)".format(suffixes.index(s)) if s in suffixes else "x.startswith({!r}, j + 1)".format(s))
+    if B in centers:
+        conditions.append("center_{}(i, j)".format(centers.index(B)))
+    elif len(B) > 1:
+        # the length is already len(B)
+        conditions.append("x.startswith({!r}, i)".format(B))
+    w.line("# {!r} {!r} -> {!r} {!r}".format(p, A, B, s))
+    w.line("if {}:".format(" and ".join(conditions)))
+    w.indent()
+    w.line("cells[i][j] |= {}".format(bit(A)))
+    # a new cell invalidates the context fits that may read it, as Growing_Context_Sensitive_Grammar._set_cell
+    if prefixes:
+        w.line("for m in range(j + 1, n + 1):")
+        w.line("    memo_left[m].clear()")
+    if suffixes:
+        w.line("for m in range(i):")
+        w.line("    memo_right[m].clear()")
+    w.line("pass")
+    w.dedent()
+
+
+def write_fit(w, name, part, nt_set, bit, kleene_prefix=False, kleene_suffix=False):
+    # Growing_Context_Sensitive_Grammar.fit of one fixed part, ends is the set of positions where part[:v + 1] can end
+    V = len(part)
+    w.line()
+    w.line("def {}(lo, hi):".format(name))
+    w.indent()
+    w.line("# {!r}".format(part))
+    w.line("if lo < 0 or hi >= n or hi < lo or hi - lo + 1 < {}:".format(V))
+    w.line("    return False")
+    for v, var in enumerate(part):
+        if v == 0:
+            if var in nt_set and kleene_prefix:
+                w.line("ends = {{e for e in range(lo, hi + 1) if any(cells[s][e] & {} for s in range(lo + 1, e + 1))}}".format(bit(var)))
+            elif var in nt_set:
+                w.line("ends = {{e for e in range(lo, hi + 1) if cells[lo][e] & {}}}".format(bit(var)))
+            elif kleene_prefix:
+                w.line("ends = {{e for e in range(lo, hi + 1) if x[e] == {!r}}}".format(var))
+            else:
+                w.line("ends = {{lo}} if x[lo] == {!r} else set()".format(var))
+        elif var in nt_set:
+            w.line("ends = {{e for e in range(lo + {}, hi + 1) if any(p < e and cells[p + 1][e] & {} for p in ends)}}".format(v, bit(var)))
+        else:
+            w.line("ends = {{p + 1 for p in ends if lo + {} <= p + 1 <= hi and x[p + 1] == {!r}}}".format(v, var))
+    w.line("return len(ends) > 0" if kleene_suffix else "return hi in ends")
+    w.dedent()
@@ -0,0 +1,135 @@
+"""
+    Compiled grammar: the normalized grammar as integer symbol ids, rule arrays and lookup tables
+
+    A compiled grammar is written to a single binary file keyed by the hash of the input grammar.
+    Loading maps the file with mmap, so workers skip normalization entirely.
+
+    File layout: MAGIC, uint64 header length, JSON header, then every array aligned to ALIGNMENT bytes.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+FORMAT_VERSION = 4
+MAGIC = b"GCSG"
+ALIGNMENT = 64
+
+
+def grammar_hash(non_terminal_set, terminal_set, start_symbol, rules: dict):
+    # canonical form of the input grammar, independent of set and dict ordering
+    canonical = [
+        FORMAT_VERSION,
+        sorted(non_terminal_set),
+        sorted(terminal_set),
+        start_symbol,
+        sorted((lhs, sorted(productions)) for lhs, productions in rules.items()),
+    ]
+    return hashlib.sha256(json.dumps(canonical, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class Compiled_Grammar:
+
+    def __init__(self, kind, non_terminals, terminals, start_symbol, meta=None, arrays=None):
+        self.kind = kind
+        # nonterminals take ids 0 .. NT - 1, so a nonterminal id is also its index in the CYK table
+        self.symbols = list(non_terminals) + list(terminals)
+        self.num_non_terminals = len(non_terminals)
+        self.symbol_to_id = {s: i for i, s in enumerate(self.symbols)}
+        self.start_symbol = start_symbol
+        self.meta = meta if meta is not None else {}
+        self.arrays = arrays if arrays is not None else {}
+
+
+    @property
+    def non_terminals(self):
+        return self.symbols[:self.num_non_terminals]
+
+
+    @property
+    def terminals(self):
+        return self.symbols[self.num_non_terminals:]
+
+
+    def encode_rules(self, name, rules):
+        # rules is a list of tuples of strings, stored CSR style:
+        # the symbols of part n are ids[offsets[n]:offsets[n + 1]]
+        parts = len(rules[0]) if len(rules) > 0 else 0
+        strings = [s for rule in rules for s in rule]
+        offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(s) for s in strings])
+        ids = np.array([self.symbol_to_id[c] for s in strings for c in s], dtype=np.int32)
+        self.meta[name + "_parts"] = parts
+        self.arrays[name + "_offsets"] = offsets
+        self.arrays[name + "_ids"] = ids
+
+
+    def decode_rules(self, name):
+        parts = self.meta[name + "_parts"]
+        offsets = self.arrays[name + "_offsets"].tolist()
+        ids = self.arrays[name + "_ids"].tolist()
+        strings = ["".join(self.symbols[c] for c in ids[offsets[n]:offsets[n + 1]]) for n in range(len(offsets) - 1)]
+        if parts == 0:
+            return []
+        return [tuple(strings[n:n + parts]) for n in range(0, len(strings), parts)]
+
+
+    def save(self, path):
+        layout = []
+        offset = 0
+        for name, array in self.arrays.items():
+            array = np.ascontiguousarray(array)
+            layout.append([name, array.dtype.str, list(array.shape), offset])
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        header = json.dumps({
+            "version": FORMAT_VERSION,
+            "kind": self.kind,
+            "symbols": self.symbols,
+            "num_non_terminals": self.num_non_terminals,
+            "start_symbol": self.start_symbol,
+            "meta": self.meta,
+            "arrays": layout,
+        }, ensure_ascii=False).encode("utf-8")
+        data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+        # write next to the target and rename, so concurrent workers never see a partial file
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for (name, _, _, array_offset), array in zip(layout, self.arrays.values()):
+                f.seek(data_start + array_offset)
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+        os.replace(tmp_path, path)
+
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError("{} is not a compiled grammar".format(path))
+        header_length, = struct.unpack_from("<Q", buffer, len(MAGIC))
+        header = json.loads(bytes(buffer[len(MAGIC) + 8:len(MAGIC) + 8 + header_length]).decode("utf-8"))
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError("{} has format version {}, expected {}".format(path, header["version"], FORMAT_VERSION))
+        data_start = -(-(len(MAGIC) + 8 + header_length) // ALIGNMENT) * ALIGNMENT
+
+        arrays = {}
+        for name, dtype, shape, offset in header["arrays"]:
+            count = int(np.prod(shape))
+            if count == 0:
+                arrays[name] = np.zeros(shape, dtype=np.dtype(dtype))
+                continue
+            # read-only views into the mapped file, nothing is copied
+            arrays[name] = np.frombuffer(buffer, dtype=np.dtype(dtype), count=count, offset=data_start + offset).reshape(shape)
+
+        symbols = header["symbols"]
+        num_non_terminals = header["num_non_terminals"]
+        return Compiled_Grammar(header["kind"], symbols[:num_non_terminals], symbols[num_non_terminals:], header["start_symbol"], header["meta"], arrays)
@@ -6,6 +6,17 @@
 """
 
 from .utils import *
+from .optimize import optimize_grammar, grammar_size
+from .compiled import Compiled_Grammar
+from .chart import Chart
+from .batch import match_many
+from .earley import Earley_Parser
+from .prefilter import Prefilter
+from .spans import iter_spans, resolve_nonterminal
+from .forest import Forest
+from .parallel import PARALLEL_THRESHOLD, wavefront_cost, run_wavefront
+from .stats import Match_Stats, Phase_Timer
+from .codegen import context_free_source, load_recognizer
 
 
 def convert_to_cnf(non_terminal_set, terminal_set, start_symbol, rules: dict):
@@ -53,14 +64,48 @@ def convert_to_cnf(non_terminal_set, terminal_set, start_symbol, rules: dict):
     return new_non_terminal_set, new_terminal_set, new_start_symbol, new_rules
 
 
+import tempfile
+
 import numpy as np
+from numpy.lib.stride_tricks import as_strided, sliding_window_view
+
+# gathered (split point, start) pairs per block of the packed kernel
+PACKED_BLOCK = 1 << 18
+
+def extract_bit(words, nt):
+    # (..., W) packed words to the (...) booleans of one nonterminal
+    return ((words[..., nt >> 6] >> np.uint64(nt & 63)) & np.uint64(1)).astype(bool)
+
 
 class Context_Free_Grammar:
 
-    def __init__(self, non_terminal_set, terminal_set, start_symbol, rules: dict):
+    # necessary conditions checked before matching, set by build_grammar
+    prefilter = None
+    # callables given the Match_Stats of every match call, see stats.py
+    stats_hooks = ()
+    # source and function of the "generated" engine, made on first use and never read from a compiled file
+    _generated_source = None
+    _generated = None
+    # the grammar without MERGE that parse forests are read from, made on first use
+    _unmerged = None
+
+    def __init__(self, non_terminal_set, terminal_set, start_symbol, rules: dict, engine="vectorized", chart="dense", chart_dir=None, optimize=True,
+                 workers=1, parallel_threshold=PARALLEL_THRESHOLD):
 
+        timer = Phase_Timer()
+        input_size = grammar_size(non_terminal_set, rules)
+        # the Earley engine works on the rules as given, keep them before the conversion
+        self.source = {"non_terminals": sorted(non_terminal_set), "start_symbol": start_symbol, "rules": {nt: list(productions) for nt, productions in rules.items()}}
         # first turn rules into CNF form
         non_terminal_set, terminal_set, start_symbol, rules = convert_to_cnf(non_terminal_set, terminal_set, start_symbol, rules)
+        timer.mark("cnf")
+        # then shrink it, the cost of CYK scales with the number of rules and nonterminals
+        if optimize:
+            non_terminal_set, terminal_set, start_symbol, rules, self.size_report = optimize_grammar(non_terminal_set, terminal_set, start_symbol, rules)
+        else:
+            self.size_report = {"before": grammar_size(non_terminal_set, rules), "after": grammar_size(non_terminal_set, rules)}
+        self.size_report["input"] = input_size
+        timer.mark("optimize")
 
         self.non_terminal_set = non_terminal_set
         self.terminal_set = terminal_set
@@ -75,8 +120,372 @@ class Context_Free_Grammar:
                     self.has_epsilon_rule = True
                     break
 
+        # "vectorized" CYK, "naive" CYK, "generated" CYK specialized to the grammar, or "earley" on the rules as given
+        self.engine = engine
+        self._earley = None
+        # "dense" boolean planes, "packed" triangular bitset chart, or "mmap" packed chart in a file under chart_dir
+        self.chart = chart
+        self.chart_dir = chart_dir
+        # long inputs on the dense vectorized engine fill each span length with workers processes
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        self._compile_rules()
+        timer.mark("index")
+        self.build_timings = timer.timings
+
+
+    def _compile_rules(self):
+        # map every nonterminal to an integer id and turn the CNF rules into index arrays once
+        nt_to_index = {nt: i for i, nt in enumerate(sorted(self.non_terminal_set))}
+        t_to_index = {t: i for i, t in enumerate(sorted(self.terminal_set - self.non_terminal_set), len(nt_to_index))}
+
+        # terminal rules A → a as (a, A) pairs, binary rules A → BC as (A, B, C) triples
+        terminal_rules = set()
+        binary_rules = set()
+        for nt, productions in self.rules.items():
+            for prod in productions:
+                if len(prod) == 1 and prod[0] in self.terminal_set:
+                    terminal_rules.add((t_to_index[prod[0]], nt_to_index[nt]))
+                elif len(prod) == 2:
+                    A, B = prod
+                    binary_rules.add((nt_to_index[nt], nt_to_index[A], nt_to_index[B]))
+
+        terminal_rules = np.array(sorted(terminal_rules), dtype=np.intp).reshape(-1, 2)
+        binary_rules = np.array(sorted(binary_rules), dtype=np.intp).reshape(-1, 3)
+        self._set_rule_arrays(sorted(nt_to_index) + sorted(t_to_index), terminal_rules, binary_rules)
+
+
+    def _set_rule_arrays(self, symbols, terminal_rules, binary_rules):
+        self.nt_to_index = {nt: i for i, nt in enumerate(symbols[:len(self.non_terminal_set)])}
+        self._terminal_rule_pairs = terminal_rules
+        self._binary_rules = binary_rules
+
+        # terminal rules keyed by the terminal
+        self._terminal_rules = {}
+        for t, nt in terminal_rules.tolist():
+            self._terminal_rules.setdefault(symbols[t], []).append(nt)
+        self._terminal_rules = {t: np.array(ids, dtype=np.intp) for t, ids in self._terminal_rules.items()}
+
+        # binary rules are sorted by A so that hits can be reduced per lhs
+        self._bin_lhs = binary_rules[:, 0]
+        self._bin_left = binary_rules[:, 1]
+        self._bin_right = binary_rules[:, 2]
+        # rules with the same lhs are contiguous, reduceat over these offsets ORs them together
+        self._bin_lhs_unique, self._bin_lhs_offsets = np.unique(self._bin_lhs, return_index=True)
+
+
+    def compile(self) -> Compiled_Grammar:
+        compiled = Compiled_Grammar(
+            "context_free",
+            sorted(self.non_terminal_set),
+            sorted(self.terminal_set - self.non_terminal_set),
+            self.S,
+            meta={"has_epsilon_rule": self.has_epsilon_rule, "size_report": self.size_report, "source": self.source,
+                  "prefilter": self.prefilter.to_dict() if self.prefilter is not None else None},
+            arrays={"terminal_rules": self._terminal_rule_pairs, "binary_rules": self._binary_rules},
+        )
+        compiled.encode_rules("rules", [(nt, prod) for nt, productions in self.rules.items() for prod in productions])
+        return compiled
+
+
+    @classmethod
+    def from_compiled(cls, compiled: Compiled_Grammar, engine="vectorized", chart="dense", chart_dir=None,
+                      workers=1, parallel_threshold=PARALLEL_THRESHOLD):
+        # skip CNF conversion, everything is already in the compiled grammar
+        timer = Phase_Timer()
+        self = cls.__new__(cls)
+        self.non_terminal_set = set(compiled.non_terminals)
+        self.terminal_set = set(compiled.terminals)
+        self.S = compiled.start_symbol
+        self.rules = {}
+        for nt, prod in compiled.decode_rules("rules"):
+            self.rules.setdefault(nt, []).append(prod)
+        self.has_epsilon_rule = compiled.meta["has_epsilon_rule"]
+        self.size_report = compiled.meta["size_report"]
+        self.source = compiled.meta["source"]
+        self.prefilter = Prefilter.from_dict(compiled.meta["prefilter"]) if compiled.meta.get("prefilter") is not None else None
+        self.engine = engine
+        self._earley = None
+        self.chart = chart
+        self.chart_dir = chart_dir
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        self._set_rule_arrays(compiled.symbols, compiled.arrays["terminal_rules"], compiled.arrays["binary_rules"])
+        timer.mark("index")
+        self.build_timings = timer.timings
+        return self
+
+
+    def allocate_table(self, L):
+        if self.chart == "packed":
+            return Chart(L, len(self.nt_to_index))
+        if self.chart == "mmap":
+            return Chart(L, len(self.nt_to_index), mmap_dir=self.chart_dir if self.chart_dir is not None else tempfile.gettempdir())
+        # one plane per nonterminal, table[nt, l - 1, i] is True if nt derives x[i:i + l]
+        return np.zeros((len(self.nt_to_index), L, L), dtype=bool)
+
+
+    def match(self, x: str, table=None) -> bool:
+        if self.stats_hooks:
+            return self._match_with_stats(x, table)
+        if self.prefilter is not None and not self.prefilter.accepts(x):
+            return False
+        if self.engine == "naive":
+            return self._match_naive(x)
+        if self.engine == "earley":
+            return self._match_earley(x)
+        if self.engine == "generated":
+            return self._match_generated(x)
+        if self.chart != "dense":
+            return self._match_packed(x, table)
+        return self._match_vectorized(x, table)
+
+
+    def _match_with_stats(self, x: str, table=None) -> bool:
+        # match with the counters of stats.py, only used when stats_hooks is set so match itself stays as it is
+        stats = Match_Stats(self, x)
+        rejected = self.prefilter is not None and not self.prefilter.accepts(x)
+        stats.mark("prefilter")
+        if rejected:
+            stats.early_exit = "prefilter"
+            return stats.finish(self, False)
+        L = len(x)
+        if self.engine == "earley":
+            result = self._match_earley(x, stats)
+        elif self.engine == "naive":
+            result = self._match_naive(x, stats)
+        elif self.engine == "generated":
+            # straight-line code, nothing is counted
+            result = self._match_generated(x)
+        else:
+            owned = table is None and L > 0
+            if owned:
+                table = self.allocate_table(L)
+            result = self._match_vectorized(x, table) if self.chart == "dense" else self._match_packed(x, table)
+            if L > 0:
+                stats.cells_filled = int(np.count_nonzero(table)) if self.chart == "dense" else table.count()
+                cells = (lambda k: table[:, k - 1, :L - k + 1].T) if self.chart == "dense" else table.cells
+                stats.rules_tried = split_checks(cells, self._bin_left, L)
+            if owned and self.chart != "dense":
+                table.close()
+        stats.mark("recognition")
+        return stats.finish(self, bool(result))
+
+
+    def match_many(self, iterable, workers=1, ordered=True, chunk_size=256, stats=None):
+        return match_many(self, iterable, workers=workers, ordered=ordered, chunk_size=chunk_size, stats=stats)
+
+
+    def recognizer(self):
+        return Context_Free_Recognizer(self)
+
+
+    def finditer(self, x: str, nonterminal=None, longest=False, overlapping=True):
+        # spans (i, j) such that nonterminal (the start symbol by default) derives x[i:j], from one CYK chart
+        # the chart is built with CYK whatever the engine, the naive and Earley engines only answer for the whole string
+        nt = resolve_nonterminal(self, nonterminal)
+        L = len(x)
+        if L == 0:
+            return
+        table = self.allocate_table(L)
+        if self.chart != "dense":
+            self._match_packed(x, table)
+            cells = np.zeros((L, L), dtype=bool)
+            for l in range(1, L + 1):
+                starts = np.arange(L - l + 1)
+                cells[starts, starts + l - 1] = table.cells(l)[:, nt]
+            table.close()
+        else:
+            self._match_vectorized(x, table)
+            cells = np.zeros((L, L), dtype=bool)
+            starts = np.arange(L)
+            for l in range(1, L + 1):
+                cells[starts[:L - l + 1], starts[:L - l + 1] + l - 1] = table[nt, l - 1, :L - l + 1]
+        yield from iter_spans(cells, longest=longest, overlapping=overlapping)
+
+
+    def find_all(self, x: str, nonterminal=None, longest=False, overlapping=True):
+        return list(self.finditer(x, nonterminal=nonterminal, longest=longest, overlapping=overlapping))
+
+
+    def parse(self, x: str, nonterminal=None):
+        # shared packed parse forest of x from nonterminal (the start symbol by default), None if x is not derived
+        # the forest reads its backpointers off the CYK chart, match itself records nothing
+        if self.size_report.get("merged"):
+            # a merged nonterminal stands for several of the input grammar, its trees would show one of them in place of the others
+            # and share their derivations, so the forest is read off the grammar built without the optimizer
+            if self._unmerged is None:
+                self._unmerged = Context_Free_Grammar(set(self.source["non_terminals"]), self.terminal_set - self.non_terminal_set, self.source["start_symbol"],
+                                                      self.source["rules"], chart=self.chart, chart_dir=self.chart_dir, optimize=False)
+            return self._unmerged.parse(x, nonterminal)
+        nt = resolve_nonterminal(self, nonterminal)
+        names = sorted(self.nt_to_index, key=self.nt_to_index.get)
+        source = set(self.source["non_terminals"])
+        display = {self.S: self.source["start_symbol"]}
+        # TERM proxies, BIN chains and the new start symbol are spliced out of the trees
+        hidden = frozenset(names) - source - set(display)
+        L = len(x)
+        if L == 0:
+            if nt != self.nt_to_index[self.S] or not self.has_epsilon_rule:
+                return None
+            return Forest((self.S, 0, 0), lambda node: [()], hidden, display)
+
+        table = self.allocate_table(L)
+        if self.chart != "dense":
+            self._match_packed(x, table)
+            cell = lambda a, i, l: table[i, i + l - 1, a]
+        else:
+            self._match_vectorized(x, table)
+            cell = lambda a, i, l: table[a, l - 1, i]
+        if not cell(nt, 0, L):
+            return None
+
+        binary = {}
+        for A, B, C in self._binary_rules.tolist():
+            binary.setdefault(A, []).append((B, C))
+
+        def alternatives(node):
+            A, i, j = node
+            a, l = self.nt_to_index[A], j - i
+            if l == 1:
+                return [(x[i],)] if a in self._terminal_rules.get(x[i], ()) else []
+            result = []
+            for B, C in binary.get(a, ()):
+                for k in range(1, l):
+                    if cell(B, i, k) and cell(C, i + k, l - k):
+                        result.append(((names[B], i, i + k), (names[C], i + k, j)))
+            return result
+
+        return Forest((names[nt], 0, L), alternatives, hidden, display)
+
 
-    def match(self, x: str) -> bool:
+    def _match_vectorized(self, x: str, table=None) -> bool:
+        # CYK Algorithm, every split point of every span of the same length in one batched operation
+        L = len(x)
+        if L == 0:
+            return self.has_epsilon_rule
+        if table is None:
+            table = self.allocate_table(L)
+        else:
+            # reused from a previous string of the same length
+            table.fill(False)
+        for i in range(L):
+            ids = self._terminal_rules.get(x[i])
+            if ids is not None:
+                table[ids, 0, i] = True
+
+        if self.workers > 1 and wavefront_cost(L, len(self._bin_lhs)) >= self.parallel_threshold:
+            run_wavefront(self, x, table, self.workers)
+        else:
+            hits = np.empty((len(self._bin_lhs), L), dtype=bool)
+            for l in range(2, L + 1):
+                self._fill_span_length(table, l, 0, L - l + 1, hits)
+
+        return bool(table[self.nt_to_index[self.S], L - 1, 0])
+
+
+    def _fill_span_length(self, table, l, first, last, hits=None):
+        # the cells of length l starting at first .. last - 1, every split point and rule at once
+        n = last - first
+        if n <= 0 or len(self._bin_lhs) == 0:
+            return
+        if hits is None:
+            hits = np.empty((len(self._bin_lhs), n), dtype=bool)
+        s_length, s_start = table.strides[1], table.strides[2]
+        for r in range(len(self._bin_lhs)):
+            # left[k - 1, i] = table[B, k - 1, i] and right[k - 1, i] = table[C, l - k - 1, i + k]
+            left = table[self._bin_left[r], 0:l - 1, first:last]
+            right = as_strided(table[self._bin_right[r], l - 2, first + 1:], shape=(l - 1, n), strides=(s_start - s_length, s_start))
+            np.any(left & right, axis=0, out=hits[r, :n])
+        table[self._bin_lhs_unique, l - 1, first:last] = np.logical_or.reduceat(hits[:, :n], self._bin_lhs_offsets, axis=0)
+
+
+    def _wavefront_step(self, x, table, l, first, last):
+        # one worker's share of a span length, see parallel.run_wavefront
+        self._fill_span_length(table, l, first, last)
+        return False
+
+
+    def _match_packed(self, x: str, chart=None) -> bool:
+        # CYK Algorithm on the packed chart, split points are processed in blocks so that gathered words stay bounded
+        L = len(x)
+        if L == 0:
+            return self.has_epsilon_rule
+        owned = chart is None
+        if owned:
+            chart = self.allocate_table(L)
+        else:
+            chart.fill(False)
+
+        NT = len(self.nt_to_index)
+        cells = np.zeros((L, NT), dtype=bool)
+        for i in range(L):
+            ids = self._terminal_rules.get(x[i])
+            if ids is not None:
+                cells[i, ids] = True
+        chart.set_cells(1, 0, cells)
+
+        # symbols used on the left and on the right of binary rules, their bits are extracted once per block
+        left_symbols, left_of_rule = np.unique(self._bin_left, return_inverse=True)
+        right_symbols, right_of_rule = np.unique(self._bin_right, return_inverse=True)
+        R = len(self._bin_lhs)
+        # cell (i, j) is stored at row triangle[j] + i, left parts of span i end at i + k - 1, right parts all end at i + l - 1
+        triangle = np.arange(L, dtype=np.int64) * np.arange(1, L + 1, dtype=np.int64) // 2
+        for l in range(2, L + 1):
+            if R == 0:
+                break
+            n = L - l + 1
+            starts = np.arange(n, dtype=np.int64)
+            right_base = triangle[l - 1:L] + starts
+            hits = np.zeros((n, R), dtype=bool)
+            block = max(1, PACKED_BLOCK // n)
+            for k0 in range(1, l, block):
+                # k is the length of the left part
+                k1 = min(k0 + block, l)
+                left = np.take(chart.data, sliding_window_view(triangle, n)[k0 - 1:k1 - 1] + starts, axis=0)
+                right = np.take(chart.data, right_base + np.arange(k0, k1, dtype=np.int64)[:, None], axis=0)
+                left_bits = [extract_bit(left, nt) for nt in left_symbols]
+                right_bits = [extract_bit(right, nt) for nt in right_symbols]
+                for r in range(R):
+                    hits[:, r] |= np.any(left_bits[left_of_rule[r]] & right_bits[right_of_rule[r]], axis=0)
+            cells = np.zeros((n, NT), dtype=bool)
+            cells[:, self._bin_lhs_unique] = np.logical_or.reduceat(hits, self._bin_lhs_offsets, axis=1)
+            chart.set_cells(l, 0, cells)
+
+        result = chart[0, L - 1, self.nt_to_index[self.S]]
+        if owned:
+            chart.close()
+        return result
+
+
+    def _match_earley(self, x: str, stats=None) -> bool:
+        # built on first use, the CNF arrays stay around for the recognizer and the charts
+        if self._earley is None:
+            self._earley = Earley_Parser(self.source["non_terminals"], self.terminal_set, self.source["start_symbol"], self.source["rules"])
+        return self._earley.match(x, stats)
+
+
+    def generated_source(self) -> str:
+        # Python source of the specialized recognizer, always made from the rules of this grammar
+        if self._generated_source is None:
+            self._generated_source = context_free_source(self)
+        return self._generated_source
+
+
+    def _match_generated(self, x: str) -> bool:
+        if self._generated is None:
+            self._generated = load_recognizer(self.generated_source())
+        return self._generated(x)
+
+
+    def __getstate__(self):
+        # a function made by exec cannot be pickled, it is loaded again from the source
+        state = self.__dict__.copy()
+        state.pop("_generated", None)
+        return state
+
+
+    def _match_naive(self, x: str, stats=None) -> bool:
         # CYK Algorithm
         L = len(x)
         NT = len(self.non_terminal_set)
@@ -101,7 +510,11 @@ class Context_Free_Grammar:
                                 if table[i, k - 1, nt_to_index[A]] and table[k, j - 1, nt_to_index[B]]:
                                     table[i, j - 1, nt_to_index[nt]] = True
 
-        return table[0, L - 1, nt_to_index[self.S]]
+        if stats is not None:
+            stats.cells_filled = int(np.count_nonzero(table))
+            left = [nt_to_index[prod[0]] for productions in self.rules.values() for prod in productions if len(prod) == 2]
+            stats.rules_tried = split_checks(lambda k: table[np.arange(L - k + 1), np.arange(k - 1, L)], left, L)
+        return bool(table[0, L - 1, nt_to_index[self.S]])
     
 
     @staticmethod
@@ -116,4 +529,96 @@ class Context_Free_Grammar:
                         return False
                     if p not in non_terminal_set and p not in terminal_set:
                         return False
-        return True
\ No newline at end of file
+        return True
+
+
+def split_checks(cells, left, L):
+    # (binary rule, split point) checks whose left part is derived, the checks that go on to read the right part
+    # cells(k) is the (L - k + 1, NT) booleans of the spans of length k, left the left symbol of every rule
+    total = 0
+    for k in range(1, L):
+        # the left part (i, k) is read by the spans of length l > k from i, there are L - k - i of them
+        derived = cells(k)[:L - k][:, left].sum(axis=1)
+        total += int(np.arange(L - k, 0, -1) @ derived)
+    return total
+
+
+class Context_Free_Recognizer:
+    # prefix-incremental CYK, feed appends symbols and only computes the cells of spans ending in them
+    # a packed or mmap chart stores cells by end position, so it grows by appending and keeps its layout
+
+    def __init__(self, grammar: Context_Free_Grammar, capacity=64):
+        self.grammar = grammar
+        self.length = 0
+        self.table = grammar.allocate_table(capacity)
+
+
+    def feed(self, chunk):
+        if isinstance(self.table, Chart):
+            return self._feed_chart(chunk)
+        g = self.grammar
+        for c in chunk:
+            e = self.length
+            if e >= self.table.shape[1]:
+                # double the capacity, the filled cells keep their (length, start) index
+                table = g.allocate_table(2 * self.table.shape[1])
+                table[:, :e, :e] = self.table
+                self.table = table
+            table = self.table
+            self.length += 1
+
+            ids = g._terminal_rules.get(c)
+            if ids is not None:
+                table[ids, 0, e] = True
+            if len(g._bin_lhs) == 0:
+                continue
+
+            # spans ending at e from the shortest, their right parts also end at e and are already done
+            s_nt, s_length, s_start = table.strides
+            for l in range(2, e + 2):
+                i = e - l + 1
+                # left[:, k - 1] = table[:, k - 1, i] and right[:, k - 1] = table[:, l - k - 1, i + k]
+                left = table[:, 0:l - 1, i]
+                right = as_strided(table[:, l - 2, i + 1], shape=(table.shape[0], l - 1), strides=(s_nt, s_start - s_length))
+                hits = np.any(left[g._bin_left] & right[g._bin_right], axis=1)
+                table[g._bin_lhs_unique, l - 1, i] = np.logical_or.reduceat(hits, g._bin_lhs_offsets)
+        return self
+
+
+    def _feed_chart(self, chunk):
+        g = self.grammar
+        chart = self.table
+        for c in chunk:
+            e = self.length
+            if e >= chart.L:
+                chart.resize(2 * chart.L)
+            self.length += 1
+
+            ids = g._terminal_rules.get(c)
+            if ids is not None:
+                for a in ids:
+                    chart[e, e, int(a)] = True
+            if len(g._bin_lhs) == 0:
+                continue
+
+            # spans (i, e) from the shortest, the left part of length k is the cell (i, i + k - 1), the right part (i + k, e)
+            cell = np.zeros(chart.NT, dtype=bool)
+            for l in range(2, e + 2):
+                i = e - l + 1
+                k = np.arange(1, l, dtype=np.int64)
+                left = chart.unpack(chart.data[(i + k - 1) * (i + k) // 2 + i])
+                right = chart.unpack(chart.data[e * (e + 1) // 2 + i + k])
+                hits = np.any(left[:, g._bin_left] & right[:, g._bin_right], axis=0)
+                cell[:] = False
+                cell[g._bin_lhs_unique] = np.logical_or.reduceat(hits, g._bin_lhs_offsets)
+                chart.data[chart.index(i, l)] |= chart.pack(cell)
+        return self
+
+
+    def accepts(self) -> bool:
+        # membership of everything fed so far
+        if self.length == 0:
+            return self.grammar.has_epsilon_rule
+        if isinstance(self.table, Chart):
+            return self.table[0, self.length - 1, self.grammar.nt_to_index[self.grammar.S]]
+        return bool(self.table[self.grammar.nt_to_index[self.grammar.S], self.length - 1, 0])
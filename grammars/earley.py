@@ -0,0 +1,131 @@
+"""
+    Earley recognizer with the Leo optimization, works directly on the context-free rules, no CNF
+
+    Time is O(n^3) in general, O(n^2) for unambiguous grammars and O(n) for LR-regular grammars,
+    Leo's deterministic reduction paths keep right recursion linear.
+    Nullable nonterminals are handled as in Aycock and Horspool: predicting a nullable nonterminal also skips over it.
+"""
+
+
+class Earley_Parser:
+
+    def __init__(self, non_terminal_set, terminal_set, start_symbol, rules: dict, leo=True):
+        self.S = start_symbol
+        self.leo = leo
+        self.non_terminal_set = set(non_terminal_set)
+        # productions as parallel lists, rules_of[nt] holds the ids of the productions of nt
+        self.lhs = []
+        self.rhs = []
+        self.rules_of = {}
+        for nt, productions in rules.items():
+            for prod in productions:
+                self.rules_of.setdefault(nt, []).append(len(self.lhs))
+                self.lhs.append(nt)
+                self.rhs.append(prod)
+
+        self.nullable = set()
+        added = True
+        while added:
+            added = False
+            for nt, prod in zip(self.lhs, self.rhs):
+                if nt not in self.nullable and all(c in self.nullable for c in prod):
+                    self.nullable.add(nt)
+                    added = True
+
+
+    def match(self, x: str, stats=None) -> bool:
+        # stats, if given, is a stats.Match_Stats that gets the items, predictions and Leo memo lookups
+        n = len(x)
+        # sets[i] holds items (rule, dot, origin), waiting[i][A] the items of sets[i] whose next symbol is A
+        sets = [[] for _ in range(n + 1)]
+        seen = [set() for _ in range(n + 1)]
+        waiting = [{} for _ in range(n + 1)]
+        # topmost[(j, A)] is the topmost complete item of the deterministic reduction path above A started at j
+        topmost = {}
+
+        def add(i, item):
+            if item not in seen[i]:
+                seen[i].add(item)
+                sets[i].append(item)
+                r, dot, _ = item
+                if dot < len(self.rhs[r]):
+                    waiting[i].setdefault(self.rhs[r][dot], []).append(item)
+
+        for r in self.rules_of.get(self.S, ()):
+            add(0, (r, 0, 0))
+
+        # checked while completing, a Leo shortcut may skip the complete start item
+        accepted = False
+
+        for i in range(n + 1):
+            c = x[i] if i < n else None
+            k = 0
+            while k < len(sets[i]):
+                r, dot, origin = sets[i][k]
+                k += 1
+                rhs = self.rhs[r]
+                if dot < len(rhs):
+                    symbol = rhs[dot]
+                    if symbol in self.non_terminal_set:
+                        # predictor
+                        for rb in self.rules_of.get(symbol, ()):
+                            add(i, (rb, 0, i))
+                        if symbol in self.nullable:
+                            add(i, (r, dot + 1, origin))
+                    elif symbol == c:
+                        # scanner
+                        add(i + 1, (r, dot + 1, origin))
+                    continue
+
+                # completer
+                A = self.lhs[r]
+                if i == n and origin == 0 and A == self.S:
+                    accepted = True
+                if self.leo and origin < i:
+                    top = self._topmost(origin, A, waiting, topmost, stats)
+                    if top is not None:
+                        top_rule, top_origin = top
+                        add(i, (top_rule, len(self.rhs[top_rule]), top_origin))
+                        continue
+                for rw, dot_w, origin_w in waiting[origin].get(A, ()):
+                    add(i, (rw, dot_w + 1, origin_w))
+
+        if stats is not None:
+            stats.cells_filled = sum(len(items) for items in sets)
+            stats.rules_tried = sum(1 for items in sets for r, dot, origin in items if dot == 0)
+        return accepted
+
+
+    def _topmost(self, j, A, waiting, topmost, stats=None):
+        # follow the deterministic reduction path iteratively, sets[j] is final since j < i
+        if stats is not None:
+            if (j, A) in topmost:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+        path = []
+        result = None
+        while True:
+            if (j, A) in topmost:
+                # no path above (j, A) keeps the item found so far
+                if topmost[(j, A)] is not None:
+                    result = topmost[(j, A)]
+                break
+            candidates = waiting[j].get(A, ())
+            if len(candidates) != 1:
+                break
+            r, dot, origin = candidates[0]
+            # A must be the last symbol, so completing A completes r without choice
+            if dot != len(self.rhs[r]) - 1:
+                break
+            path.append((j, A))
+            result = (r, origin)
+            if origin == j:
+                break
+            j, A = origin, self.lhs[r]
+        # every step of the path has the same topmost item
+        for key in path:
+            topmost[key] = result
+        if len(path) == 0:
+            topmost[(j, A)] = result
+        return result
@@ -0,0 +1,108 @@
+"""
+    Shared packed parse forest over a filled chart
+
+    A node (symbol, i, j) stands for symbol deriving x[i:j], its packed alternatives are tuples of children,
+    each child is a node or a terminal character. Alternatives are read off the chart when a node is first visited,
+    so matching never pays for them and only the nodes reachable from the root are ever built.
+    Every node is shared by all the derivations that use it, counting is one pass over the nodes and trees are produced lazily.
+
+    Trees are nested tuples (symbol, child, ...) with characters as leaves.
+    Helper nonterminals introduced by a normal form are hidden, their children are spliced into the parent.
+"""
+
+
+class Forest:
+
+    def __init__(self, root, alternatives, hidden=frozenset(), names=None):
+        # alternatives(node) returns the list of packed alternatives of node
+        self.root = root
+        self._alternatives = alternatives
+        self._nodes = {}
+        self.hidden = hidden
+        # display name of a symbol, a normal form may have renamed the start symbol
+        self.names = names if names is not None else {}
+
+
+    def alternatives(self, node):
+        if node not in self._nodes:
+            self._nodes[node] = self._alternatives(node)
+        return self._nodes[node]
+
+
+    def nodes(self):
+        # every node reachable from the root
+        seen = {self.root}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for alternative in self.alternatives(node):
+                for child in alternative:
+                    if not isinstance(child, str) and child not in seen:
+                        seen.add(child)
+                        stack.append(child)
+        return seen
+
+
+    def count(self) -> int:
+        # number of derivations, the product of the children summed over the alternatives, bottom up without recursion
+        counts = {}
+        stack = [(self.root, False)]
+        visiting = set()
+        while stack:
+            node, expanded = stack.pop()
+            if node in counts:
+                continue
+            if expanded:
+                visiting.discard(node)
+                total = 0
+                for alternative in self.alternatives(node):
+                    product = 1
+                    for child in alternative:
+                        if not isinstance(child, str):
+                            product *= counts[child]
+                    total += product
+                counts[node] = total
+                continue
+            if node in visiting:
+                raise ValueError("cyclic derivations at {}, the number of derivations is infinite".format(node))
+            visiting.add(node)
+            stack.append((node, True))
+            for alternative in self.alternatives(node):
+                for child in alternative:
+                    if not isinstance(child, str) and child not in counts:
+                        stack.append((child, False))
+        return counts[self.root]
+
+
+    def trees(self):
+        # lazily yields every derivation tree, one at a time
+        symbol = self.root[0]
+        for children in self._expand(self.root):
+            yield (self.names.get(symbol, symbol),) + children
+
+
+    def __iter__(self):
+        return self.trees()
+
+
+    def _expand(self, node):
+        # children sequences of node, hidden children already spliced in
+        for alternative in self.alternatives(node):
+            yield from self._expand_from(alternative, 0)
+
+
+    def _expand_from(self, alternative, k):
+        if k == len(alternative):
+            yield ()
+            return
+        child = alternative[k]
+        if isinstance(child, str):
+            heads = [(child,)]
+        elif child[0] in self.hidden:
+            heads = self._expand(child)
+        else:
+            symbol = self.names.get(child[0], child[0])
+            heads = (((symbol,) + children,) for children in self._expand(child))
+        for head in heads:
+            for rest in self._expand_from(alternative, k + 1):
+                yield head + rest
@@ -2,14 +2,50 @@
     Test growing context sensitive grammar matching in polynomial time
 """
 
+import heapq
+import tempfile
+
 import numpy as np
 from .utils import UNIT
+from .optimize import optimize_grammar, grammar_size
+from .compiled import Compiled_Grammar
+from .chart import Chart
+from .prefilter import Prefilter
+from .spans import iter_spans, resolve_nonterminal
+from .forest import Forest
+from .parallel import PARALLEL_THRESHOLD, wavefront_cost, run_wavefront
+from .batch import match_many
+from .stats import Match_Stats, Phase_Timer
+from .codegen import growing_context_sensitive_source, load_recognizer
 
 class Growing_Context_Sensitive_Grammar:
-    
-    def __init__(self, non_terminal_set, terminal_set, start_symbol, rules: dict):
 
+    # necessary conditions checked before matching, set by build_grammar
+    prefilter = None
+    # callables given the Match_Stats of every match call, see stats.py
+    stats_hooks = ()
+    # source and function of the "generated" engine, made on first use and never read from a compiled file
+    _generated_source = None
+    _generated = None
+    # the input grammar, and the grammar built from it without MERGE that parse forests are read from
+    source = None
+    _unmerged = None
+
+    def __init__(self, non_terminal_set, terminal_set, start_symbol, rules: dict, engine="pass", chart="dense", chart_dir=None, optimize=True,
+                 workers=1, parallel_threshold=PARALLEL_THRESHOLD):
+
+        timer = Phase_Timer()
+        input_size = grammar_size(non_terminal_set, rules)
+        self.source = {"non_terminals": sorted(non_terminal_set), "terminals": sorted(terminal_set), "start_symbol": start_symbol,
+                       "rules": {lhs: list(productions) for lhs, productions in rules.items()}}
         non_terminal_set, terminal_set, start_symbol, rules = UNIT(non_terminal_set, terminal_set, start_symbol, rules)
+        timer.mark("unit")
+        if optimize:
+            non_terminal_set, terminal_set, start_symbol, rules, self.size_report = optimize_grammar(non_terminal_set, terminal_set, start_symbol, rules)
+        else:
+            self.size_report = {"before": grammar_size(non_terminal_set, rules), "after": grammar_size(non_terminal_set, rules)}
+        self.size_report["input"] = input_size
+        timer.mark("optimize")
 
         self.non_terminal_set = non_terminal_set
         self.terminal_set = terminal_set
@@ -40,11 +76,115 @@ class Growing_Context_Sensitive_Grammar:
                 self.has_epsilon_rule = True
                 break
 
+        # "pass" does one pass over span lengths, "worklist" runs to the fixpoint,
+        # "generated" runs the pass engine as code specialized to the grammar (match only, spans and forests use "pass"),
+        # a grammar with a rule that rewrites no single nonterminal runs the pass engine itself
+        self.engine = engine
+        # "dense" (L, L, NT) table, "packed" triangular bitset chart, or "mmap" packed chart in a file under chart_dir
+        self.chart = chart
+        self.chart_dir = chart_dir
+        # long inputs of the "worklist" engine on a dense table fill each span length with workers processes
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        self._index_rules()
+        timer.mark("index")
+        self.build_timings = timer.timings
+
+
+    def _index_rules(self):
+        # lookup structures built once per grammar, never inside match
+        self.nt_to_index = {nt: i for i, nt in enumerate(sorted(self.non_terminal_set))}
+        self._nt_list = sorted(self.non_terminal_set)
+        self._rule_list = [rule for productions in self.rules.values() for rule in productions]
+        # the longest prefix, center or suffix bounds the rows of the fit scratch buffer
+        self._max_vars = max([1] + [max(len(p), len(B), len(s)) for p, A, B, s in self._rule_list])
+        # the split of a start rule such as S -> SaS leaves an empty lhs center, code is only generated when every rule rewrites a nonterminal
+        self._generatable = all(A in self.nt_to_index for p, A, B, s in self._rule_list)
 
-    def fit(self, vars, i, j, check_table, x, kleene_prefix=False, kleene_suffix=False):
+        # span length bounds and end symbols of every center, every symbol of a center covers at least one position
+        # and a center of terminals covers exactly its length, the ends are None for a nonterminal (any character)
+        self._rule_min_length = []
+        self._rule_max_length = []
+        self._rule_ends = []
+        for p, A, B, s in self._rule_list:
+            self._rule_min_length.append(max(2, len(B)))
+            terminal_only = len(B) > 0 and all(c not in self.non_terminal_set for c in B)
+            self._rule_max_length.append(len(B) if terminal_only else None)
+            self._rule_ends.append(tuple(c if c not in self.non_terminal_set else None for c in (B[:1], B[-1:])) if len(B) > 0 else (None, None))
+        # candidate rules per (first character, last character, length), beyond every finite bound the length does not matter
+        self._length_cap = max([2] + self._rule_min_length + [l for l in self._rule_max_length if l is not None]) + 1
+        self._span_rules = {}
+
+        # dependency index for the worklist engine: nonterminal -> (rule, part, position, part length)
+        self._dependency_index = {}
+        self._independent_rules = []
+        for r, (p, A, B, s) in enumerate(self._rule_list):
+            independent = True
+            for where, part in (("prefix", p), ("center", B), ("suffix", s)):
+                for q, var in enumerate(part):
+                    if var in self.non_terminal_set:
+                        self._dependency_index.setdefault(var, []).append((r, where, q, len(part)))
+                        independent = False
+            if independent:
+                self._independent_rules.append(r)
+
+        # terminals read by suffixes, appending one of them to a stream may complete a suffix of an earlier span
+        self._suffix_terminal_index = {}
+        for r, (p, A, B, s) in enumerate(self._rule_list):
+            for q, var in enumerate(s):
+                if var in self.terminal_set:
+                    self._suffix_terminal_index.setdefault(var, []).append((r, "suffix", q, len(s)))
+
+
+    def compile(self) -> Compiled_Grammar:
+        compiled = Compiled_Grammar(
+            "growing_context_sensitive",
+            sorted(self.non_terminal_set),
+            sorted(self.terminal_set - self.non_terminal_set),
+            self.S,
+            meta={"has_epsilon_rule": self.has_epsilon_rule, "size_report": self.size_report, "source": self.source,
+                  "prefilter": self.prefilter.to_dict() if self.prefilter is not None else None},
+        )
+        # store the decomposed (prefix, lhs center, rhs center, suffix) form, so loading skips it
+        compiled.encode_rules("rules", [(lhs, p, A, B, s) for lhs, productions in self.rules.items() for p, A, B, s in productions])
+        return compiled
+
+
+    @classmethod
+    def from_compiled(cls, compiled: Compiled_Grammar, engine="pass", chart="dense", chart_dir=None,
+                      workers=1, parallel_threshold=PARALLEL_THRESHOLD):
+        timer = Phase_Timer()
+        self = cls.__new__(cls)
+        self.non_terminal_set = set(compiled.non_terminals)
+        self.terminal_set = set(compiled.terminals)
+        self.S = compiled.start_symbol
+        self.rules = {}
+        for lhs, p, A, B, s in compiled.decode_rules("rules"):
+            self.rules.setdefault(lhs, []).append((p, A, B, s))
+        self.has_epsilon_rule = compiled.meta["has_epsilon_rule"]
+        self.size_report = compiled.meta["size_report"]
+        self.source = compiled.meta.get("source")
+        self.prefilter = Prefilter.from_dict(compiled.meta["prefilter"]) if compiled.meta.get("prefilter") is not None else None
+        self.engine = engine
+        self.chart = chart
+        self.chart_dir = chart_dir
+        self.workers = workers
+        self.parallel_threshold = parallel_threshold
+        self._index_rules()
+        timer.mark("index")
+        self.build_timings = timer.timings
+        return self
+
+
+    def fit(self, vars, i, j, check_table, x, kleene_prefix=False, kleene_suffix=False, scratch=None, stats=None):
         # this is regular expression matching problem, dynamic time warping
         # assume that the vars contains some non-terminal symbols, replace them in regex with *
+        # scratch, if given, is a preallocated (V, L) buffer reused instead of allocating a new table
 
+        if stats is not None:
+            stats.fit_calls += 1
+            if len(vars) == 0 or i < 0 or j >= len(x) or j < i or j - i + 1 < len(vars):
+                stats.fit_early_exits += 1
         if len(vars) == 0:
             return True
         if i < 0 or j >= len(x) or j < i:
@@ -54,8 +194,12 @@ class Growing_Context_Sensitive_Grammar:
 
         L = j - i + 1
         V = len(vars)
-        nt_to_index = {nt: i for i, nt in enumerate(self.non_terminal_set)}
-        table = np.zeros((V, L), dtype=bool)
+        nt_to_index = self.nt_to_index
+        if scratch is not None and scratch.shape[0] >= V and scratch.shape[1] >= L:
+            table = scratch[:V, :L]
+            table.fill(False)
+        else:
+            table = np.zeros((V, L), dtype=bool)
 
         var = vars[0]
         if kleene_prefix:
@@ -97,46 +241,369 @@ class Growing_Context_Sensitive_Grammar:
 
 
 
-    def match(self, x: str) -> bool:
+    def allocate_table(self, L):
+        if self.chart == "packed":
+            return Chart(L, len(self.non_terminal_set))
+        if self.chart == "mmap":
+            return Chart(L, len(self.non_terminal_set), mmap_dir=self.chart_dir if self.chart_dir is not None else tempfile.gettempdir())
+        return np.zeros((L, L, len(self.non_terminal_set)), dtype=bool)
+
+
+    def _terminal_cells(self, table, first, L):
+        # (L - first, NT) booleans of the length one cells from first
+        if isinstance(table, Chart):
+            return table.cells(1, first, L)
+        return table[np.arange(first, L), np.arange(first, L)]
+
+
+    def match_many(self, iterable, workers=1, ordered=True, chunk_size=256, stats=None):
+        return match_many(self, iterable, workers=workers, ordered=ordered, chunk_size=chunk_size, stats=stats)
+
+
+    def recognizer(self):
+        # the recognizer keeps the worklist fixpoint table, its answers are those of match only on that engine
+        if self.engine != "worklist":
+            raise ValueError("the prefix-incremental recognizer runs the worklist fixpoint, build the grammar with engine=\"worklist\" (engine is {!r})".format(self.engine))
+        return Growing_Context_Sensitive_Recognizer(self)
+
+
+    def match(self, x: str, table=None) -> bool:
         # generalized CYK Algorithm
+        stats = Match_Stats(self, x) if self.stats_hooks else None
+        if self.prefilter is not None and not self.prefilter.accepts(x):
+            if stats is not None:
+                stats.early_exit = "prefilter"
+                stats.mark("prefilter")
+                return stats.finish(self, False)
+            return False
+        if stats is not None:
+            stats.mark("prefilter")
+        if self.engine == "generated" and self._generatable:
+            # the generated code keeps its own chart, nothing is counted
+            result = self._match_generated(x)
+            if stats is not None:
+                stats.mark("recognition")
+                return stats.finish(self, result)
+            return result
         L = len(x)
-        NT = len(self.non_terminal_set)
-        nt_to_index = {nt: i for i, nt in enumerate(self.non_terminal_set)}
         # initialize the table
-        table = np.zeros((L, L, NT), dtype=bool)
+        owned = table is None
+        if owned:
+            table = self.allocate_table(L)
+        else:
+            # reused from a previous string of the same length
+            table.fill(False)
+        self._fill(x, table, stats)
+
+        # a Python bool on every path, a dense table entry is a NumPy bool
+        result = bool(table[0, L-1, self.nt_to_index[self.S]])
+        if stats is not None:
+            stats.mark("recognition")
+            stats.cells_filled = table.count() if isinstance(table, Chart) else int(np.count_nonzero(table))
+        if owned and isinstance(table, Chart):
+            table.close()
+        if stats is not None:
+            return stats.finish(self, result)
+        return result
+
+
+    def finditer(self, x: str, nonterminal=None, longest=False, overlapping=True):
+        # spans (i, j) such that nonterminal (the start symbol by default) derives x[i:j], from one chart
+        # contexts are read from the whole of x, a span may match thanks to the text around it
+        nt = resolve_nonterminal(self, nonterminal)
+        L = len(x)
+        if L == 0:
+            return
+        table = self.allocate_table(L)
+        self._fill(x, table)
+        if isinstance(table, Chart):
+            cells = np.zeros((L, L), dtype=bool)
+            for l in range(1, L + 1):
+                starts = np.arange(L - l + 1)
+                cells[starts, starts + l - 1] = table.cells(l)[:, nt]
+            table.close()
+        else:
+            cells = table[:, :, nt]
+        yield from iter_spans(cells, longest=longest, overlapping=overlapping)
+
+
+    def find_all(self, x: str, nonterminal=None, longest=False, overlapping=True):
+        return list(self.finditer(x, nonterminal=nonterminal, longest=longest, overlapping=overlapping))
+
+
+    def parse(self, x: str, nonterminal=None):
+        # shared packed parse forest of x from nonterminal (the start symbol by default), None if x is not derived
+        # the forest reads its backpointers off the chart, match itself records nothing
+        # a node covers the center of a rule, its contexts are checked against x but are not children
+        if self.size_report.get("merged") and self.source is not None:
+            # a merged nonterminal stands for several of the input grammar, its trees would show one of them in place of the others
+            # and share their derivations, so the forest is read off the grammar built without the optimizer
+            if self._unmerged is None:
+                self._unmerged = Growing_Context_Sensitive_Grammar(set(self.source["non_terminals"]), set(self.source["terminals"]), self.source["start_symbol"],
+                                                                   self.source["rules"], engine=self.engine, chart=self.chart, chart_dir=self.chart_dir, optimize=False)
+            return self._unmerged.parse(x, nonterminal)
+        nt = resolve_nonterminal(self, nonterminal)
+        L = len(x)
+        if L == 0:
+            if nt != self.nt_to_index[self.S] or not self.has_epsilon_rule:
+                return None
+            return Forest((self.S, 0, 0), lambda node: [()])
+
+        table = self.allocate_table(L)
+        self._fill(x, table)
+        if not table[0, L - 1, nt]:
+            return None
+
+        memo_left = [{} for _ in range(L + 1)]
+        memo_right = [{} for _ in range(L + 1)]
+        scratch = np.zeros((self._max_vars, L), dtype=bool)
+        by_center = {}
+        for r, (p, A, B, s) in enumerate(self._rule_list):
+            by_center.setdefault(A, []).append(r)
+
+        def cuts(B, a, j, v=0):
+            # ways to cut x[a:j] into the symbols B[v:], one cell or character each
+            if v == len(B):
+                if a == j:
+                    yield ()
+                return
+            var = B[v]
+            if var in self.non_terminal_set:
+                for b in range(a + 1, j - (len(B) - v - 1) + 1):
+                    if table[a, b - 1, self.nt_to_index[var]]:
+                        for rest in cuts(B, b, j, v + 1):
+                            yield ((var, a, b),) + rest
+            elif a < j and x[a] == var:
+                for rest in cuts(B, a + 1, j, v + 1):
+                    yield (var,) + rest
+
+        def alternatives(node):
+            A, i, j = node
+            result = []
+            for r in by_center.get(A, ()):
+                p, _, B, s = self._rule_list[r]
+                if j - i == 1 and B in self.terminal_set:
+                    if B == x[i] and self._terminal_context(p, s, i, x):
+                        result.append((B,))
+                elif self._fires(r, i, j - 1, table, x, memo_left, memo_right, scratch):
+                    result.extend(cuts(B, i, j))
+            # the same cut may come from rules that differ only in their contexts
+            return list(dict.fromkeys(result))
+
+        return Forest((self._nt_list[nt], 0, L), alternatives)
+
+
+    def _candidate_rules(self, a, b, l):
+        # ids of the rules that may fire on a span of length l from character a to character b, in rule order
+        key = (a, b, min(l, self._length_cap))
+        rules = self._span_rules.get(key)
+        if rules is None:
+            rules = self._span_rules[key] = [r for r in range(len(self._rule_list)) if self._may_fire(r, a, b, key[2])]
+        return rules
+
+
+    def _may_fire(self, r, a, b, l):
+        # the necessary conditions of the rule index, fit decides the rest
+        first, last = self._rule_ends[r]
+        max_length = self._rule_max_length[r]
+        return (self._rule_min_length[r] <= l and (max_length is None or l <= max_length)
+                and (first is None or first == a) and (last is None or last == b))
+
+
+    def generated_source(self) -> str:
+        # Python source of the specialized recognizer, always made from the rules of this grammar
+        if self._generated_source is None:
+            self._generated_source = growing_context_sensitive_source(self)
+        return self._generated_source
+
+
+    def _match_generated(self, x: str) -> bool:
+        if self._generated is None:
+            self._generated = load_recognizer(self.generated_source(), terminal_context=self._terminal_context)
+        return self._generated(x)
+
+
+    def __getstate__(self):
+        # a function made by exec cannot be pickled, it is loaded again from the source
+        state = self.__dict__.copy()
+        state.pop("_generated", None)
+        return state
+
+
+    def _fill(self, x, table, stats=None):
+        L = len(x)
         # fill the table
-        for i in range(L):
+        self._fill_terminals(x, table)
+
+        # context fits per boundary, memo_left[i][p] for the prefix ending at i - 1, memo_right[j][s] for the suffix starting at j + 1
+        memo_left = [{} for _ in range(L + 1)]
+        memo_right = [{} for _ in range(L + 1)]
+        scratch = np.zeros((self._max_vars, L), dtype=bool)
+
+        if self.engine == "worklist":
+            if self.workers > 1 and not isinstance(table, Chart) and wavefront_cost(L, len(self._rule_list)) >= self.parallel_threshold:
+                # the fixpoint does not depend on the order cells are set in, so workers sweep all lengths until nothing changes
+                # the single pass depends on that order and always runs serially
+                run_wavefront(self, x, table, self.workers, repeats=True)
+            else:
+                self._fill_worklist(x, table, memo_left, memo_right, scratch, stats)
+        else:
+            for l in range(2, L + 1):
+                for i in range(L - l + 1):
+                    j = i + l - 1
+                    for r in self._candidate_rules(x[i], x[j], l):
+                        if self._fires(r, i, j, table, x, memo_left, memo_right, scratch, stats):
+                            self._set_cell(i, j, self._rule_list[r][1], table, memo_left, memo_right)
+
+
+    def _wavefront_step(self, x, table, l, first, last):
+        # one worker's share of a span length, see parallel.run_wavefront
+        # other workers write cells between rounds, so the context memos start empty every round
+        L = len(x)
+        memo_left = [{} for _ in range(L + 1)]
+        memo_right = [{} for _ in range(L + 1)]
+        scratch = np.zeros((self._max_vars, L), dtype=bool)
+        changed = False
+        for i in range(first, last):
+            j = i + l - 1
+            for r in self._candidate_rules(x[i], x[j], l):
+                if self._fires(r, i, j, table, x, memo_left, memo_right, scratch):
+                    changed |= self._set_cell(i, j, self._rule_list[r][1], table, memo_left, memo_right)
+        return changed
+
+
+    def _fill_terminals(self, x, table, start=0):
+        L = len(x)
+        nt_to_index = self.nt_to_index
+        for i in range(start, L):
             for lhs, productions in self.rules.items():
                 for p, A, B, s in productions:
-                    if B in self.terminal_set and B == x[i]:
-                        # now check context, only for terminal symbols
-                        x_prefix = x[max(i - len(p) + 1, 0):i]
-                        x_suffix = x[i + 1:min(i + len(s) + 1, L)]
-                        if (x_prefix == p or p == "") and (x_suffix == s or s == ""):
-                            table[i, i, nt_to_index[A]] = True
-
-
-        for l in range(2, L + 1):
-            for i in range(L - l + 1):
-                j = i + l - 1
-                for lhs, productions in self.rules.items():
-                    for p, A, B, s in productions:
-                        # check whether p can be a prefix of the substring
-                        if not self.fit(p, 0, i-1, table, x, kleene_prefix=True):
-                            continue
-
-                        # check whether s can be a suffix of the substring
-                        if not self.fit(s, j+1, L-1, table, x, kleene_suffix=True):
-                            continue
-
-                        # now check whether the B can be the substring
-                        if not self.fit(B, i, j, table, x):
-                            continue
-
-                        # if all pass then make the table[i, j, nt] to be True
-                        table[i, j, nt_to_index[A]] = True
-
-        return table[0, L-1, nt_to_index[self.S]]
+                    if B in self.terminal_set and B == x[i] and self._terminal_context(p, s, i, x):
+                        table[i, i, nt_to_index[A]] = True
+
+
+    @staticmethod
+    def _terminal_context(p, s, i, x):
+        # now check context, only for terminal symbols
+        x_prefix = x[max(i - len(p) + 1, 0):i]
+        x_suffix = x[i + 1:min(i + len(s) + 1, len(x))]
+        return (x_prefix == p or p == "") and (x_suffix == s or s == "")
+
+
+    def _fires(self, r, i, j, table, x, memo_left, memo_right, scratch, stats=None):
+        p, A, B, s = self._rule_list[r]
+        L = len(x)
+        if stats is not None:
+            stats.rules_tried += 1
+
+        # check whether p can be a prefix of the substring
+        fits = memo_left[i].get(p)
+        if fits is None:
+            fits = memo_left[i][p] = self.fit(p, 0, i-1, table, x, kleene_prefix=True, scratch=scratch, stats=stats)
+            if stats is not None:
+                stats.cache_misses += 1
+        elif stats is not None:
+            stats.cache_hits += 1
+        if not fits:
+            return False
+
+        # check whether s can be a suffix of the substring
+        fits = memo_right[j].get(s)
+        if fits is None:
+            fits = memo_right[j][s] = self.fit(s, j+1, L-1, table, x, kleene_suffix=True, scratch=scratch, stats=stats)
+            if stats is not None:
+                stats.cache_misses += 1
+        elif stats is not None:
+            stats.cache_hits += 1
+        if not fits:
+            return False
+
+        # now check whether the B can be the substring
+        return self.fit(B, i, j, table, x, scratch=scratch, stats=stats)
+
+
+    def _set_cell(self, i, j, A, table, memo_left, memo_right):
+        # make the table[i, j, nt] to be True, returns whether the cell is new
+        a = self.nt_to_index[A]
+        if table[i, j, a]:
+            return False
+        table[i, j, a] = True
+        # a context only reads cells on its side of the boundary,
+        # prefixes of later boundaries and suffixes of earlier boundaries read this cell
+        for b in range(j + 1, len(memo_left)):
+            memo_left[b].clear()
+        for b in range(i):
+            memo_right[b].clear()
+        return True
+
+
+    def _fill_worklist(self, x, table, memo_left, memo_right, scratch, stats=None):
+        # incremental fixpoint: a (span, rule) pair is examined again only when a cell it may read becomes True
+        L = len(x)
+        seeds = []
+        # rules that read no cell at all only depend on x
+        for r in self._independent_rules:
+            max_length = self._rule_max_length[r] if self._rule_max_length[r] is not None else L
+            for l in range(self._rule_min_length[r], min(max_length, L) + 1):
+                for i in range(L - l + 1):
+                    seeds.append((i, i + l - 1, r))
+        for i, a in zip(*np.nonzero(self._terminal_cells(table, 0, L))):
+            seeds.extend(self._dependents(i, i, self._nt_list[a], L))
+        self._run_worklist(x, table, memo_left, memo_right, scratch, seeds, stats)
+
+
+    def _run_worklist(self, x, table, memo_left, memo_right, scratch, seeds, stats=None):
+        # shorter spans first, so a center is usually examined once all of its parts are known
+        L = len(x)
+        worklist = []
+        queued = set()
+
+        def push(i, j, r):
+            if (i, j, r) not in queued and self._may_fire(r, x[i], x[j], j - i + 1):
+                queued.add((i, j, r))
+                heapq.heappush(worklist, (j - i, i, r))
+
+        for span in seeds:
+            push(*span)
+
+        while worklist:
+            l, i, r = heapq.heappop(worklist)
+            j = i + l
+            queued.discard((i, j, r))
+            if not self._fires(r, i, j, table, x, memo_left, memo_right, scratch, stats):
+                continue
+            A = self._rule_list[r][1]
+            if self._set_cell(i, j, A, table, memo_left, memo_right):
+                for span in self._dependents(i, j, A, L):
+                    push(*span)
+
+
+    def _dependents(self, a, b, nt, L, index=None):
+        # (span, rule) pairs whose prefix, suffix or center may read the cell (a, b, nt)
+        # q is the position of nt in the part and n the length of the part, every symbol covers at least one position
+        index = index if index is not None else self._dependency_index
+        for r, where, q, n in index.get(nt, ()):
+            min_length = self._rule_min_length[r]
+            if where == "center":
+                # nt at position q, so the span starts q or more before a, exactly at a when nt is first
+                starts = [a] if q == 0 else range(0, a - q + 1)
+                ends = [b] if q == n - 1 else range(b + n - 1 - q, L)
+                for i in starts:
+                    for j in ends:
+                        if j - i + 1 >= min_length:
+                            yield i, j, r
+            elif where == "prefix":
+                # the prefix ends at i - 1 and it is not kleene on the right
+                starts = [b + 1] if q == n - 1 else range(b + 1 + n - 1 - q, L)
+                for i in starts:
+                    for j in range(i + min_length - 1, L):
+                        yield i, j, r
+            else:
+                # the suffix starts at j + 1 and it is not kleene on the left
+                ends = [a - 1] if q == 0 else range(0, a - q)
+                for j in ends:
+                    for i in range(0, j - min_length + 2):
+                        yield i, j, r
     
 
     @staticmethod
@@ -176,3 +643,76 @@ class Growing_Context_Sensitive_Grammar:
                     return False
 
         return True
+
+
+class Growing_Context_Sensitive_Recognizer:
+    # prefix-incremental generalized CYK on the worklist fixpoint
+    # a single pass over span lengths is not prefix-incremental, suffixes of earlier spans read the appended symbols,
+    # so the recognizer keeps the fixpoint table, and accepts() answers as match of a grammar with engine="worklist"
+
+    def __init__(self, grammar: Growing_Context_Sensitive_Grammar, capacity=64):
+        self.grammar = grammar
+        self.x = ""
+        self.capacity = capacity
+        self.table = grammar.allocate_table(capacity)
+        self.scratch = np.zeros((grammar._max_vars, capacity), dtype=bool)
+        self.memo_left = [{}]
+        self.memo_right = [{}]
+
+
+    def feed(self, chunk):
+        if len(chunk) == 0:
+            return self
+        g = self.grammar
+        old = len(self.x)
+        self.x += chunk
+        x = self.x
+        L = len(x)
+
+        if L > self.capacity:
+            self.capacity = max(L, 2 * self.capacity)
+            if isinstance(self.table, Chart):
+                self.table.resize(self.capacity)
+            else:
+                table = g.allocate_table(self.capacity)
+                table[:old, :old] = self.table[:old, :old]
+                self.table = table
+            self.scratch = np.zeros((g._max_vars, self.capacity), dtype=bool)
+        table = self.table
+        self.memo_left.extend({} for _ in range(L - old))
+        self.memo_right.extend({} for _ in range(L - old))
+        # every suffix region grew
+        for memo in self.memo_right:
+            memo.clear()
+
+        # terminal cells of the new symbols and of earlier symbols whose terminal suffix now has more text
+        first = max(0, old - max([0] + [len(s) for p, A, B, s in g._rule_list]))
+        before = g._terminal_cells(table, first, L).copy()
+        g._fill_terminals(x, table, start=first)
+        added = g._terminal_cells(table, first, L) & ~before
+
+        seeds = []
+        for i, a in zip(*np.nonzero(added)):
+            i += first
+            for b in range(i + 1, L + 1):
+                self.memo_left[b].clear()
+            seeds.extend(g._dependents(i, i, g._nt_list[a], L))
+        # every span ending in the new symbols
+        for j in range(old, L):
+            for r in range(len(g._rule_list)):
+                min_length = g._rule_min_length[r]
+                for i in range(0, j - min_length + 2):
+                    seeds.append((i, j, r))
+        # earlier spans whose suffix may now read a new terminal
+        for t in range(old, L):
+            seeds.extend(g._dependents(t, t, x[t], L, index=g._suffix_terminal_index))
+
+        g._run_worklist(x, table, self.memo_left, self.memo_right, self.scratch, seeds)
+        return self
+
+
+    def accepts(self) -> bool:
+        # membership of everything fed so far
+        if len(self.x) == 0:
+            return self.grammar.has_epsilon_rule
+        return bool(self.table[0, len(self.x) - 1, self.grammar.nt_to_index[self.grammar.S]])
@@ -0,0 +1,117 @@
+"""
+    Grammar optimizer, shrinks |G| before recognition since CYK cost scales with the number of rules and nonterminals
+
+    PRUNE: Eliminate nonterminals that derive no terminal string and symbols unreachable from the start symbol
+    MERGE: Merge nonterminals with the same productions, this shares terminal proxies and BIN chains left over by earlier steps
+"""
+
+
+def grammar_size(non_terminal_set, rules: dict):
+    used = set()
+    for lhs, productions in rules.items():
+        used.update(c for c in lhs if c in non_terminal_set)
+        for prod in productions:
+            used.update(c for c in prod if c in non_terminal_set)
+    return {
+        "non_terminals": len(used),
+        "rules": sum(len(productions) for productions in rules.values()),
+        "symbols": sum(len(lhs) + len(prod) for lhs, productions in rules.items() for prod in productions),
+    }
+
+
+def PRUNE(non_terminal_set, terminal_set, start_symbol, rules: dict):
+    # A nonterminal is generating if one of its rules has only terminals and generating nonterminals.
+    # Only single nonterminal lhs are analysed, a nonterminal that is rewritten in a context (αAβ → αγβ) is kept as generating.
+    # A rule is reachable if every symbol of its lhs is reachable, then so is every symbol of its rhs.
+    # Drop rules with a non-generating symbol, then rules that are not reachable.
+
+    generating = set(terminal_set)
+    for lhs in rules:
+        if len(lhs) > 1:
+            generating.update(c for c in lhs if c in non_terminal_set)
+    added = True
+    while added:
+        added = False
+        for lhs, productions in rules.items():
+            if lhs in generating or len(lhs) != 1:
+                continue
+            for prod in productions:
+                if all(c in generating for c in prod):
+                    generating.add(lhs)
+                    added = True
+                    break
+
+    new_rules = {}
+    for lhs, productions in rules.items():
+        if all(c in generating for c in lhs):
+            new_rules[lhs] = [prod for prod in productions if all(c in generating for c in prod)]
+
+    reachable = {start_symbol}
+    added = True
+    while added:
+        added = False
+        for lhs, productions in new_rules.items():
+            if all(c in reachable for c in lhs):
+                for prod in productions:
+                    for c in prod:
+                        if c not in reachable:
+                            reachable.add(c)
+                            added = True
+
+    new_rules = {lhs: productions for lhs, productions in new_rules.items() if all(c in reachable for c in lhs)}
+    # the start symbol keeps an entry, even if it derives nothing
+    new_rules.setdefault(start_symbol, [])
+    new_non_terminal_set = {nt for nt in non_terminal_set if nt in reachable and nt in generating}
+    new_non_terminal_set.add(start_symbol)
+
+    return new_non_terminal_set, terminal_set, start_symbol, new_rules
+
+
+def MERGE(non_terminal_set, terminal_set, start_symbol, rules: dict):
+    # Nonterminals with exactly the same set of productions derive the same strings, keep one of them.
+    # Merging may make more nonterminals equal (shared chains), so repeat until nothing changes.
+    # The start symbol and nonterminals that appear in a context (a lhs longer than one symbol) are never merged.
+    # Also returns the merged nonterminals mapped to the one kept, so they can still be looked up by name.
+
+    in_context = set()
+    for lhs in rules:
+        if len(lhs) > 1:
+            in_context.update(lhs)
+
+    rules = {lhs: list(dict.fromkeys(productions)) for lhs, productions in rules.items()}
+    non_terminal_set = set(non_terminal_set)
+    merged = {}
+    while True:
+        groups = {}
+        for lhs, productions in rules.items():
+            if len(lhs) == 1 and lhs != start_symbol and lhs not in in_context:
+                groups.setdefault(frozenset(productions), []).append(lhs)
+        rename = {}
+        for group in groups.values():
+            keep = min(group)
+            for nt in group:
+                if nt != keep:
+                    rename[nt] = keep
+        if len(rename) == 0:
+            break
+        merged = {nt: rename.get(kept, kept) for nt, kept in merged.items()}
+        merged.update(rename)
+
+        new_rules = {}
+        for lhs, productions in rules.items():
+            if lhs in rename:
+                continue
+            new_rules[lhs] = list(dict.fromkeys("".join(rename.get(c, c) for c in prod) for prod in productions))
+        rules = new_rules
+        non_terminal_set -= set(rename)
+
+    return non_terminal_set, terminal_set, start_symbol, rules, merged
+
+
+def optimize_grammar(non_terminal_set, terminal_set, start_symbol, rules: dict):
+    # returns the optimized grammar and a report of the sizes before and after and of the merged nonterminals
+    before = grammar_size(non_terminal_set, rules)
+    non_terminal_set, terminal_set, start_symbol, rules = PRUNE(non_terminal_set, terminal_set, start_symbol, rules)
+    non_terminal_set, terminal_set, start_symbol, rules, merged = MERGE(non_terminal_set, terminal_set, start_symbol, rules)
+    after = grammar_size(non_terminal_set, rules)
+    return non_terminal_set, terminal_set, start_symbol, rules, {"before": before, "after": after, "merged": merged}
@@ -0,0 +1,91 @@
+"""
+    Wavefront-parallel chart filling
+
+    The cells of one span length only read shorter spans, so each anti-diagonal is split into contiguous ranges of starts,
+    one per worker process. The dense chart lives in multiprocessing.shared_memory, every worker maps it and writes its own cells,
+    a barrier separates span lengths.
+    A grammar that sets repeats=True (contexts may read cells of any length) runs rounds on a length until no worker changes a cell,
+    and sweeps all lengths again until a whole sweep changes nothing, so the table is the fixpoint of every rule.
+
+    Starting processes costs milliseconds, below PARALLEL_THRESHOLD estimated operations the serial kernels are used.
+"""
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from threading import BrokenBarrierError
+
+import numpy as np
+
+# estimated (cell, split point, rule) operations below which a parallel fill does not pay off
+PARALLEL_THRESHOLD = 2 * 10**8
+
+
+def wavefront_cost(L, rules):
+    # cells times split points summed over span lengths, times rules
+    return L ** 3 // 6 * max(rules, 1)
+
+
+def split(n, parts):
+    # parts contiguous (first, last) ranges covering range(n), as even as possible
+    bounds = [n * k // parts for k in range(parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _wavefront_worker(grammar, x, name, shape, rank, workers, barrier, changed, repeats):
+    shm = shared_memory.SharedMemory(name=name)
+    table = np.ndarray(shape, dtype=bool, buffer=shm.buf)
+    try:
+        L = len(x)
+        while True:
+            swept = False
+            for l in range(2, L + 1):
+                first, last = split(L - l + 1, workers)[rank]
+                while True:
+                    changed[rank] = grammar._wavefront_step(x, table, l, first, last)
+                    barrier.wait()
+                    if not repeats:
+                        break
+                    again = any(changed[:])
+                    swept |= again
+                    # nobody writes changed again before everyone has read it
+                    barrier.wait()
+                    if not again:
+                        break
+            # a context of a shorter span may read a cell that a longer span just set
+            if not swept:
+                break
+    except BrokenBarrierError:
+        pass
+    except BaseException:
+        # wake up the others instead of leaving them at the barrier
+        barrier.abort()
+        raise
+    finally:
+        del table
+        shm.close()
+
+
+def run_wavefront(grammar, x, table, workers, repeats=False):
+    # fills the dense table whose length one cells are already set, returns the filled copy
+    shm = shared_memory.SharedMemory(create=True, size=max(table.nbytes, 1))
+    try:
+        shared = np.ndarray(table.shape, dtype=bool, buffer=shm.buf)
+        shared[...] = table
+        barrier = mp.Barrier(workers)
+        changed = mp.Array("b", workers, lock=False)
+        processes = [
+            mp.Process(target=_wavefront_worker, args=(grammar, x, shm.name, table.shape, rank, workers, barrier, changed, repeats))
+            for rank in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        if any(process.exitcode != 0 for process in processes):
+            raise RuntimeError("a wavefront worker failed")
+        table[...] = shared
+        del shared
+    finally:
+        shm.close()
+        shm.unlink()
+    return table
@@ -0,0 +1,199 @@
+"""
+    Pre-filter: necessary conditions on a string, checked in O(n) before the recognizer runs
+
+    alphabet: every character is a terminal
+    minimum length: exact for context-free grammars, the shortest start rule for noncontracting grammars, 0 otherwise
+    first and last terminals: the symbols that can ever reach the first (last) position of a sentential form
+    Parikh invariants: weights w with w·count(lhs) = w·count(rhs) for every rule, so w·count(x) = w(S) for every derivable x
+
+    Every condition is sound for any grammar, a rejected string is never in the language.
+"""
+
+from collections import Counter
+from fractions import Fraction
+from math import lcm
+
+
+def minimum_length(non_terminal_set, start_symbol, rules: dict, context_free):
+    if context_free:
+        # shortest terminal string derivable from each nonterminal, relaxed until stable
+        lengths = {nt: None for nt in non_terminal_set}
+        changed = True
+        while changed:
+            changed = False
+            for nt, productions in rules.items():
+                for prod in productions:
+                    parts = [1 if p not in non_terminal_set else lengths[p] for p in prod]
+                    if None in parts:
+                        continue
+                    if lengths[nt] is None or sum(parts) < lengths[nt]:
+                        lengths[nt] = sum(parts)
+                        changed = True
+        return lengths[start_symbol] if lengths[start_symbol] is not None else 0
+
+    # noncontracting rules never shorten a sentential form, the first step rewrites S itself
+    # S → ε is allowed as long as S never comes back
+    start_recurs = any(start_symbol in prod for productions in rules.values() for prod in productions)
+    if all(len(prod) >= len(lhs) or (lhs == start_symbol and not start_recurs) for lhs, productions in rules.items() for prod in productions):
+        return min((len(prod) for prod in rules.get(start_symbol, [])), default=0)
+    return 0
+
+
+def end_symbols(non_terminal_set, terminal_set, start_symbol, rules: dict, end):
+    # symbols that can stand at index end (0 or -1) of a sentential form, None if any symbol can
+    # a rule whose lhs ends there puts the end of its rhs there, an empty rhs uncovers an unknown neighbour
+    start_recurs = any(start_symbol in prod for productions in rules.values() for prod in productions)
+    symbols = {start_symbol}
+    changed = True
+    while changed:
+        changed = False
+        for lhs, productions in rules.items():
+            if lhs[end] not in symbols:
+                continue
+            for prod in productions:
+                if len(prod) == 0:
+                    if lhs != start_symbol or start_recurs:
+                        return None
+                    continue
+                if prod[end] not in symbols:
+                    symbols.add(prod[end])
+                    changed = True
+    return symbols & terminal_set
+
+
+def end_symbols_context_free(non_terminal_set, terminal_set, start_symbol, rules: dict, end):
+    # FIRST (end=0) or LAST (end=-1) set of the start symbol, nullable symbols let the next one through
+    nullable = set()
+    changed = True
+    while changed:
+        changed = False
+        for nt, productions in rules.items():
+            if nt not in nullable and any(all(p in nullable for p in prod) for prod in productions):
+                nullable.add(nt)
+                changed = True
+
+    sets = {nt: set() for nt in non_terminal_set}
+    changed = True
+    while changed:
+        changed = False
+        for nt, productions in rules.items():
+            for prod in productions:
+                for p in (prod if end == 0 else prod[::-1]):
+                    new = sets[p] if p in non_terminal_set else {p}
+                    if not new <= sets[nt]:
+                        sets[nt] |= new
+                        changed = True
+                    if p not in nullable:
+                        break
+    return sets[start_symbol] & terminal_set
+
+
+def parikh_invariants(non_terminal_set, terminal_set, start_symbol, rules: dict):
+    # integer weights over the terminals with their value, from the nullspace of the rule count matrix
+    symbols = sorted(set(non_terminal_set) | set(terminal_set) | {c for lhs, ps in rules.items() for s in [lhs] + ps for c in s})
+    column = {c: k for k, c in enumerate(symbols)}
+    matrix = []
+    for lhs, productions in rules.items():
+        for prod in productions:
+            row = [Fraction(0)] * len(symbols)
+            for c in prod:
+                row[column[c]] += 1
+            for c in lhs:
+                row[column[c]] -= 1
+            matrix.append(row)
+
+    # reduced row echelon form, exact
+    pivots = []
+    r = 0
+    for k in range(len(symbols)):
+        pivot = next((i for i in range(r, len(matrix)) if matrix[i][k] != 0), None)
+        if pivot is None:
+            continue
+        matrix[r], matrix[pivot] = matrix[pivot], matrix[r]
+        matrix[r] = [v / matrix[r][k] for v in matrix[r]]
+        for i in range(len(matrix)):
+            if i != r and matrix[i][k] != 0:
+                factor = matrix[i][k]
+                matrix[i] = [a - factor * b for a, b in zip(matrix[i], matrix[r])]
+        pivots.append(k)
+        r += 1
+
+    invariants = []
+    for free in range(len(symbols)):
+        if free in pivots:
+            continue
+        w = [Fraction(0)] * len(symbols)
+        w[free] = Fraction(1)
+        for i, k in enumerate(pivots):
+            w[k] = -matrix[i][free]
+        scale = lcm(*(v.denominator for v in w))
+        w = [int(v * scale) for v in w]
+        weights = {c: w[column[c]] for c in sorted(terminal_set) if c in column and w[column[c]] != 0}
+        if len(weights) > 0:
+            invariants.append((weights, w[column[start_symbol]]))
+    return invariants
+
+
+class Prefilter:
+
+    def __init__(self, terminal_set, min_length=0, first=None, last=None, invariants=()):
+        self.terminal_set = set(terminal_set)
+        self.min_length = min_length
+        # None when unknown, any terminal may then come first (last)
+        self.first = first
+        self.last = last
+        self.invariants = list(invariants)
+
+
+    @classmethod
+    def from_grammar(cls, non_terminal_set, terminal_set, start_symbol, rules: dict):
+        terminal_set = set(terminal_set) - set(non_terminal_set)
+        context_free = all(len(lhs) == 1 and lhs in non_terminal_set for lhs in rules)
+        ends = end_symbols_context_free if context_free else end_symbols
+        return cls(
+            terminal_set,
+            minimum_length(non_terminal_set, start_symbol, rules, context_free),
+            ends(non_terminal_set, terminal_set, start_symbol, rules, 0),
+            ends(non_terminal_set, terminal_set, start_symbol, rules, -1),
+            parikh_invariants(non_terminal_set, terminal_set, start_symbol, rules),
+        )
+
+
+    def to_dict(self):
+        return {
+            "terminals": sorted(self.terminal_set),
+            "min_length": self.min_length,
+            "first": sorted(self.first) if self.first is not None else None,
+            "last": sorted(self.last) if self.last is not None else None,
+            "invariants": [[weights, value] for weights, value in self.invariants],
+        }
+
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d["terminals"],
+            d["min_length"],
+            set(d["first"]) if d["first"] is not None else None,
+            set(d["last"]) if d["last"] is not None else None,
+            [(weights, value) for weights, value in d["invariants"]],
+        )
+
+
+    def accepts(self, x: str) -> bool:
+        # False only if x is certainly not derivable
+        if len(x) < self.min_length:
+            return False
+        if len(x) == 0:
+            return True
+        if self.first is not None and x[0] not in self.first:
+            return False
+        if self.last is not None and x[-1] not in self.last:
+            return False
+        counts = Counter(x)
+        if not self.terminal_set.issuperset(counts):
+            return False
+        for weights, value in self.invariants:
+            if sum(w * counts[c] for c, w in weights.items()) != value:
+                return False
+        return True
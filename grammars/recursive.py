@@ -1,7 +1,76 @@
+import heapq
+import sys
+import time
+from collections import OrderedDict, deque
+
+from .compiled import Compiled_Grammar
+from .batch import match_many
+from .aho_corasick import Aho_Corasick
+from .prefilter import Prefilter
+from .stats import Match_Stats, Phase_Timer
+
+
+class _Unknown:
+    # third result of a bounded search, falsy so that it never reads as a match
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return "UNKNOWN"
+
+    def __reduce__(self):
+        # stays a singleton across processes
+        return "UNKNOWN"
+
+
+UNKNOWN = _Unknown()
+
+
+def form_size(x, states):
+    # approximate bytes held for a sentential form and its automaton states
+    return sys.getsizeof(x) + (sys.getsizeof(states) if states is not None else 0)
+
+
+class Visited_Set:
+    # visited sentential forms, least recently seen forms are evicted beyond max_entries
+    # an evicted form may be explored again, which costs time but never changes the result
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self.forms = OrderedDict()
+        self.bytes = 0
+        # forms ever added, evicted ones included
+        self.added = 0
+
+    def __contains__(self, x):
+        if x in self.forms:
+            self.forms.move_to_end(x)
+            return True
+        return False
+
+    def __len__(self):
+        return len(self.forms)
+
+    def add(self, x):
+        self.forms[x] = None
+        self.added += 1
+        self.bytes += sys.getsizeof(x)
+        if self.max_entries is not None and len(self.forms) > self.max_entries:
+            evicted, _ = self.forms.popitem(last=False)
+            self.bytes -= sys.getsizeof(evicted)
+
 
 class Recursive_Grammar:
 
-    def __init__(self, non_terminal_set, terminal_set, start_symbol, rules: dict):
+    # necessary conditions checked before matching, set by build_grammar
+    prefilter = None
+    # callables given the Match_Stats of every match call, see stats.py
+    stats_hooks = ()
+
+    def __init__(self, non_terminal_set, terminal_set, start_symbol, rules: dict, engine="aho_corasick",
+                 strategy="dfs", max_steps=None, max_seconds=None, max_memory=None, max_visited=None):
+        timer = Phase_Timer()
         self.non_terminal_set = non_terminal_set
         self.terminal_set = terminal_set
         self.S = start_symbol
@@ -15,26 +84,154 @@ class Recursive_Grammar:
                     self._reverse_rules[prod] = []
                 self._reverse_rules[prod].append(nt)
 
-    def match(self, x: str, cache=None) -> bool:
-        # recursively
-        if cache is None:
-            cache = {self.S: True}
-
-        if x in cache:
-            return cache[x]
-        
-        for i in range(1, len(x) + 1):
-            for j in range(0, i):
-                substr = x[j:i]
-                # n
-                replacements = self._reverse_rules.get(substr, [])
-                for r in replacements:
-                    if self.match(x[:j] + r + x[i:], cache):
-                        cache[x] = True
+        # "aho_corasick" finds every applicable reduction in one scan, "naive" looks up every substring
+        self.engine = engine
+        self._automaton = Aho_Corasick(self._reverse_rules.keys())
+        timer.mark("index")
+        self.build_timings = timer.timings
+
+        # search defaults, the membership problem is undecidable in general so every limit is optional
+        # strategy is "dfs", "bfs" or "best_first" (shortest sentential form first), max_memory is in bytes
+        self.strategy = strategy
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.max_memory = max_memory
+        self.max_visited = max_visited
+
+
+    def compile(self) -> Compiled_Grammar:
+        compiled = Compiled_Grammar("recursive", sorted(self.non_terminal_set), sorted(self.terminal_set - self.non_terminal_set), self.S,
+                                    meta={"prefilter": self.prefilter.to_dict() if self.prefilter is not None else None})
+        compiled.encode_rules("rules", [(nt, prod) for nt, productions in self.rules.items() for prod in productions])
+        return compiled
+
+
+    @classmethod
+    def from_compiled(cls, compiled: Compiled_Grammar, engine="aho_corasick"):
+        rules = {}
+        for nt, prod in compiled.decode_rules("rules"):
+            rules.setdefault(nt, []).append(prod)
+        self = cls(set(compiled.non_terminals), set(compiled.terminals), compiled.start_symbol, rules, engine=engine)
+        self.prefilter = Prefilter.from_dict(compiled.meta["prefilter"]) if compiled.meta.get("prefilter") is not None else None
+        return self
+
+
+    def match_many(self, iterable, workers=1, ordered=True, chunk_size=256, stats=None):
+        return match_many(self, iterable, workers=workers, ordered=ordered, chunk_size=chunk_size, stats=stats)
+
+
+    def match(self, x: str, strategy=None, max_steps=None, max_seconds=None, max_memory=None):
+        # search backwards from x by reductions until the start symbol is reached
+        # returns True, False, or UNKNOWN when a budget runs out before the search is decided
+        strategy = strategy if strategy is not None else self.strategy
+        max_steps = max_steps if max_steps is not None else self.max_steps
+        max_seconds = max_seconds if max_seconds is not None else self.max_seconds
+        max_memory = max_memory if max_memory is not None else self.max_memory
+
+        if self.stats_hooks:
+            stats = Match_Stats(self, x)
+            if x != self.S and self.prefilter is not None and not self.prefilter.accepts(x):
+                stats.early_exit = "prefilter"
+                stats.mark("prefilter")
+                return stats.finish(self, False)
+            stats.mark("prefilter")
+            result = x == self.S or self._search(x, strategy, max_steps, max_seconds, max_memory, stats)
+            stats.mark("recognition")
+            # a form explored is the start symbol, a visited form or a new one
+            stats.cache_hits = stats.forms_explored - stats.cache_misses - (1 if result is True and x != self.S else 0)
+            return stats.finish(self, result)
+
+        if x == self.S:
+            return True
+        if self.prefilter is not None and not self.prefilter.accepts(x):
+            return False
+        return self._search(x, strategy, max_steps, max_seconds, max_memory)
+
+
+    def _search(self, x, strategy, max_steps, max_seconds, max_memory, stats=None):
+        deadline = time.perf_counter() + max_seconds if max_seconds is not None else None
+        visited = Visited_Set(self.max_visited)
+        visited.add(x)
+        root = (x, self._automaton.scan(x) if self.engine != "naive" else None)
+
+        # frontier bytes are tracked next to the visited set to bound the memory of the whole search
+        frontier_bytes = form_size(*root)
+        steps = 0
+        try:
+            if strategy == "dfs":
+                # a stack of successor iterators, explores in the same order as the recursive search
+                stack = [(self._successors(*root), form_size(*root))]
+            elif strategy == "bfs":
+                frontier = deque([root])
+            elif strategy == "best_first":
+                # shortest sentential form first, ties in insertion order
+                frontier = [(len(x), 0, root)]
+            else:
+                raise ValueError("unknown search strategy {}".format(strategy))
+
+            while True:
+                if max_steps is not None and steps >= max_steps:
+                    return UNKNOWN
+                if deadline is not None and time.perf_counter() > deadline:
+                    return UNKNOWN
+                if max_memory is not None and visited.bytes + frontier_bytes > max_memory:
+                    return UNKNOWN
+
+                if strategy == "dfs":
+                    if len(stack) == 0:
+                        return False
+                    successors, size = stack[-1]
+                    child = next(successors, None)
+                    if child is None:
+                        stack.pop()
+                        frontier_bytes -= size
+                        continue
+                    children = (child,)
+                else:
+                    if len(frontier) == 0:
+                        return False
+                    form = frontier.popleft() if strategy == "bfs" else heapq.heappop(frontier)[2]
+                    frontier_bytes -= form_size(*form)
+                    children = self._successors(*form)
+
+                for y, y_states in children:
+                    steps += 1
+                    if y == self.S:
                         return True
-        cache[x] = False
-        return False
-    
+                    if y in visited:
+                        continue
+                    visited.add(y)
+                    size = form_size(y, y_states)
+                    frontier_bytes += size
+                    if strategy == "dfs":
+                        stack.append((self._successors(y, y_states), size))
+                    elif strategy == "bfs":
+                        frontier.append((y, y_states))
+                    else:
+                        heapq.heappush(frontier, (len(y), steps, (y, y_states)))
+        finally:
+            if stats is not None:
+                stats.forms_explored = steps
+                # x itself was added before the search, every other form is looked up once before it is added
+                stats.cache_misses = visited.added - 1
+
+
+    def _successors(self, x, states):
+        # every form one reduction away from x, by end position, then by start position
+        if states is None:
+            for i in range(1, len(x) + 1):
+                for j in range(0, i):
+                    for r in self._reverse_rules.get(x[j:i], ()):
+                        yield x[:j] + r + x[i:], None
+            return
+
+        outputs = self._automaton.outputs
+        for t in range(len(x)):
+            for substr in outputs[states[t]]:
+                j = t + 1 - len(substr)
+                for r in self._reverse_rules[substr]:
+                    yield self._automaton.reduce(x, states, j, t + 1, r)
+
 
     @staticmethod
     def check_grammar(rules: dict):
@@ -0,0 +1,319 @@
+"""
+    Regular grammars, right-linear (A → wB, A → w) or left-linear (A → Bw, A → w) with w a string of terminals
+
+    The grammar is turned into an NFA, made deterministic by the subset construction and minimized,
+    the DFA is a NumPy transition table of shape (states, |terminals| + 1), the last column takes every other character.
+    Matching is a single scan, O(n) whatever the grammar. Spans and parse forests come from the CYK grammar of the same rules.
+"""
+
+import numpy as np
+
+from .compiled import Compiled_Grammar
+from .context_free import Context_Free_Grammar
+from .batch import match_many
+from .stats import Match_Stats, Phase_Timer
+
+
+def linear_side(non_terminal_set, rules: dict):
+    # "right" or "left" when every production has at most one nonterminal at that end, None otherwise
+    right = left = True
+    for productions in rules.values():
+        for prod in productions:
+            positions = [k for k, p in enumerate(prod) if p in non_terminal_set]
+            if len(positions) > 1:
+                return None
+            if len(positions) == 1:
+                right = right and positions[0] == len(prod) - 1
+                left = left and positions[0] == 0
+    if right:
+        return "right"
+    if left:
+        return "left"
+    return None
+
+
+def build_nfa(non_terminal_set, start_symbol, rules: dict, side):
+    # states are integers, edges[q] lists (symbol, r) with symbol None for an ε move
+    # right-linear: A → wB reads w from A to B, A → w reads w from A to the final state
+    # left-linear: A → Bw reads w from B to A, A → w reads w from the initial state to A, S accepts
+    states = {nt: q for q, nt in enumerate(sorted(non_terminal_set))}
+    edges = [[] for _ in states]
+
+    def new_state():
+        edges.append([])
+        return len(edges) - 1
+
+    def path(q, w, r):
+        for c in w[:-1]:
+            s = new_state()
+            edges[q].append((c, s))
+            q = s
+        edges[q].append((w[-1] if len(w) > 0 else None, r))
+
+    outer = new_state()
+    for nt, productions in rules.items():
+        for prod in productions:
+            if side == "right":
+                if len(prod) > 0 and prod[-1] in non_terminal_set:
+                    path(states[nt], prod[:-1], states[prod[-1]])
+                else:
+                    path(states[nt], prod, outer)
+            else:
+                if len(prod) > 0 and prod[0] in non_terminal_set:
+                    path(states[prod[0]], prod[1:], states[nt])
+                else:
+                    path(outer, prod, states[nt])
+
+    if side == "right":
+        return edges, states[start_symbol], {outer}
+    return edges, outer, {states[start_symbol]}
+
+
+def closure(edges, qs):
+    stack = list(qs)
+    result = set(qs)
+    while stack:
+        q = stack.pop()
+        for c, r in edges[q]:
+            if c is None and r not in result:
+                result.add(r)
+                stack.append(r)
+    return frozenset(result)
+
+
+def subset_construction(edges, start, finals, alphabet):
+    # DFA over the columns of alphabet plus one column for every other character, the empty set is the dead state
+    column = {c: k for k, c in enumerate(alphabet)}
+    dead = frozenset()
+    first = closure(edges, [start])
+    ids = {dead: 0, first: 1}
+    sets = [dead, first]
+    rows = []
+    k = 0
+    while k < len(sets):
+        moves = [set() for _ in range(len(alphabet) + 1)]
+        for q in sets[k]:
+            for c, r in edges[q]:
+                if c is not None:
+                    moves[column[c]].add(r)
+        row = []
+        for move in moves:
+            target = closure(edges, move)
+            if target not in ids:
+                ids[target] = len(sets)
+                sets.append(target)
+            row.append(ids[target])
+        rows.append(row)
+        k += 1
+    transitions = np.array(rows, dtype=np.intp)
+    accepting = np.array([len(s & finals) > 0 for s in sets], dtype=bool)
+    return transitions, accepting, 1, 0
+
+
+def minimize(transitions, accepting, start, dead):
+    # Moore's partition refinement, states are split by their block and the blocks of their successors until stable
+    blocks = accepting.astype(np.intp)
+    count = len(np.unique(blocks))
+    while True:
+        signature = np.column_stack([blocks, blocks[transitions]])
+        _, refined = np.unique(signature, axis=0, return_inverse=True)
+        refined = refined.reshape(-1)
+        if refined.max() + 1 == count:
+            break
+        blocks = refined
+        count = refined.max() + 1
+
+    representative = np.zeros(count, dtype=np.intp)
+    representative[blocks[::-1]] = np.arange(len(blocks))[::-1]
+    return blocks[transitions[representative]], accepting[representative], int(blocks[start]), int(blocks[dead])
+
+
+class Regular_Grammar:
+
+    # callables given the Match_Stats of every match call, see stats.py
+    stats_hooks = ()
+    # CYK grammar of the same rules, made on first use for spans and parse forests, which the DFA does not give
+    _context_free = None
+
+    def __init__(self, non_terminal_set, terminal_set, start_symbol, rules: dict):
+        timer = Phase_Timer()
+        self.non_terminal_set = non_terminal_set
+        self.terminal_set = terminal_set
+        self.S = start_symbol
+        self.rules = rules
+
+        side = linear_side(non_terminal_set, rules)
+        alphabet = sorted(terminal_set - non_terminal_set)
+        edges, start, finals = build_nfa(non_terminal_set, start_symbol, rules, side)
+        timer.mark("nfa")
+        transitions, accepting, start, dead = subset_construction(edges, start, finals, alphabet)
+        timer.mark("subset_construction")
+        self._set_dfa(alphabet, *minimize(transitions, accepting, start, dead))
+        timer.mark("minimize")
+        self.build_timings = timer.timings
+
+
+    def _set_dfa(self, alphabet, transitions, accepting, start, dead):
+        self.alphabet = alphabet
+        self.transitions = transitions
+        self.accepting = accepting
+        self.start = start
+        self.dead = dead
+        self.has_epsilon_rule = bool(accepting[start])
+        self._column = {c: k for k, c in enumerate(alphabet)}
+        # sorted code points of the alphabet, the batch mode maps characters to columns by binary search
+        self._codes = np.array([ord(c) for c in alphabet], dtype=np.uint32)
+        # plain lists are faster than NumPy scalars for the one string scan
+        self._rows = transitions.tolist()
+        self._accepting = accepting.tolist()
+
+
+    def compile(self) -> Compiled_Grammar:
+        compiled = Compiled_Grammar(
+            "regular",
+            sorted(self.non_terminal_set),
+            self.alphabet,
+            self.S,
+            meta={"start": self.start, "dead": self.dead},
+            arrays={"transitions": self.transitions, "accepting": self.accepting},
+        )
+        compiled.encode_rules("rules", [(nt, prod) for nt, productions in self.rules.items() for prod in productions])
+        return compiled
+
+
+    @classmethod
+    def from_compiled(cls, compiled: Compiled_Grammar):
+        # the DFA is loaded as is, no construction
+        timer = Phase_Timer()
+        self = cls.__new__(cls)
+        self.non_terminal_set = set(compiled.non_terminals)
+        self.terminal_set = set(compiled.terminals)
+        self.S = compiled.start_symbol
+        self.rules = {}
+        for nt, prod in compiled.decode_rules("rules"):
+            self.rules.setdefault(nt, []).append(prod)
+        self._set_dfa(compiled.terminals, compiled.arrays["transitions"], compiled.arrays["accepting"], compiled.meta["start"], compiled.meta["dead"])
+        timer.mark("index")
+        self.build_timings = timer.timings
+        return self
+
+
+    def match(self, x: str) -> bool:
+        if self.stats_hooks:
+            return self._match_with_stats(x)
+        rows = self._rows
+        other = len(self.alphabet)
+        q = self.start
+        for c in x:
+            q = rows[q][self._column.get(c, other)]
+            if q == self.dead:
+                return False
+        return self._accepting[q]
+
+
+    def _match_with_stats(self, x: str) -> bool:
+        # the same scan, counting transitions, only used when stats_hooks is set
+        stats = Match_Stats(self, x)
+        rows = self._rows
+        other = len(self.alphabet)
+        q = self.start
+        result = None
+        for c in x:
+            q = rows[q][self._column.get(c, other)]
+            stats.rules_tried += 1
+            if q == self.dead:
+                stats.early_exit = "dead_state"
+                result = False
+                break
+        if result is None:
+            result = self._accepting[q]
+        stats.mark("recognition")
+        return stats.finish(self, result)
+
+
+    def match_batch(self, strings) -> np.ndarray:
+        # all strings advance through the table together, one step per position
+        # sorted by decreasing length, the strings still running at step t are a prefix of the batch
+        strings = list(strings)
+        results = np.zeros(len(strings), dtype=bool)
+        if len(strings) == 0:
+            return results
+        lengths = np.array([len(x) for x in strings], dtype=np.intp)
+        order = np.argsort(-lengths, kind="stable")
+        lengths = lengths[order]
+
+        codes = np.frombuffer("".join(strings[k] for k in order).encode("utf-32-le"), dtype=np.uint32)
+        columns = np.searchsorted(self._codes, codes)
+        found = columns < len(self._codes)
+        found[found] = self._codes[columns[found]] == codes[found]
+        columns[~found] = len(self.alphabet)
+
+        grid = np.zeros((len(strings), lengths[0]), dtype=np.intp)
+        grid[np.arange(lengths[0]) < lengths[:, None]] = columns
+        # running[t] counts the strings longer than t
+        running = len(strings) - np.searchsorted(lengths[::-1], np.arange(lengths[0]), side="right")
+
+        states = np.full(len(strings), self.start, dtype=np.intp)
+        for t in range(lengths[0]):
+            k = running[t]
+            states[:k] = self.transitions[states[:k], grid[:k, t]]
+        results[order] = self.accepting[states]
+        return results
+
+
+    def match_many(self, iterable, workers=1, ordered=True, chunk_size=256, stats=None):
+        return match_many(self, iterable, workers=workers, ordered=ordered, chunk_size=chunk_size, stats=stats)
+
+
+    def recognizer(self):
+        return Regular_Recognizer(self)
+
+
+    def _as_context_free(self) -> Context_Free_Grammar:
+        if self._context_free is None:
+            self._context_free = Context_Free_Grammar(set(self.non_terminal_set), set(self.terminal_set), self.S, self.rules)
+        return self._context_free
+
+
+    def finditer(self, x: str, nonterminal=None, longest=False, overlapping=True):
+        return self._as_context_free().finditer(x, nonterminal=nonterminal, longest=longest, overlapping=overlapping)
+
+
+    def find_all(self, x: str, nonterminal=None, longest=False, overlapping=True):
+        return self._as_context_free().find_all(x, nonterminal=nonterminal, longest=longest, overlapping=overlapping)
+
+
+    def parse(self, x: str, nonterminal=None):
+        return self._as_context_free().parse(x, nonterminal=nonterminal)
+
+
+    @staticmethod
+    def check_grammar(non_terminal_set, terminal_set, start_symbol, rules: dict):
+        # context free, and all rules right-linear or all rules left-linear
+        if not Context_Free_Grammar.check_grammar(non_terminal_set, terminal_set, start_symbol, rules):
+            return False
+        return linear_side(non_terminal_set, rules) is not None
+
+
+class Regular_Recognizer:
+    # the DFA state is all there is to keep between chunks
+
+    def __init__(self, grammar: Regular_Grammar):
+        self.grammar = grammar
+        self.state = grammar.start
+        self.length = 0
+
+
+    def feed(self, chunk):
+        g = self.grammar
+        other = len(g.alphabet)
+        q = self.state
+        for c in chunk:
+            q = g._rows[q][g._column.get(c, other)]
+        self.state = q
+        self.length += len(chunk)
+        return self
+
+
+    def accepts(self) -> bool:
+        return self.grammar._accepting[self.state]
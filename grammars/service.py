@@ -0,0 +1,245 @@
+"""
+    Asyncio matching service
+
+    Match_Service runs match calls in an executor so the event loop never blocks, with at most a per-grammar number
+    of calls of one grammar running at a time. Concurrent requests for the same (grammar, input) share one computation,
+    and results are kept in a bounded cache with least recently used eviction and a time to live.
+
+    serve() puts a service behind a local TCP server speaking JSON lines, a stand-in for the RPC layer:
+    request {"id": ..., "grammar": name, "input": x}, response {"id": ..., "result": true | false | "UNKNOWN"} or {"id": ..., "error": message}.
+    Match_Client is the matching client, loadtest.py drives both and reports latency percentiles.
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .recursive import UNKNOWN
+
+_MISSING = object()
+
+
+class Result_Cache:
+    # least recently used results, an entry also expires ttl seconds after it was stored (never with ttl=None)
+
+    def __init__(self, max_entries=10000, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.evicted = 0
+        self.expired = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        value, expires = entry
+        if expires is not None and self.clock() >= expires:
+            del self.entries[key]
+            self.expired += 1
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (value, self.clock() + self.ttl if self.ttl is not None else None)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class Match_Service:
+
+    def __init__(self, executor=None, workers=4, per_grammar_limit=2, cache_size=10000, ttl=300.0):
+        # executor defaults to a thread pool of workers threads, a process pool also works but pickles the grammar with every call
+        self._owned = executor is None
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=workers, thread_name_prefix="match")
+        self.per_grammar_limit = per_grammar_limit
+        self.cache = Result_Cache(cache_size, ttl)
+        # name -> (grammar, version, semaphore), a grammar registered again under its name gets a new version
+        self.grammars = {}
+        self._versions = itertools.count()
+        self._in_flight = {}
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "computed": 0, "errors": 0}
+
+
+    async def add_grammar(self, name, non_terminal_set, terminal_set, start_symbol, rules, limit=None, **options):
+        # build_grammar runs in the executor too, normalization may take a while; options go to build_grammar
+        from . import build_grammar
+        loop = asyncio.get_running_loop()
+        grammar = await loop.run_in_executor(self.executor, functools.partial(build_grammar, non_terminal_set, terminal_set, start_symbol, rules, **options))
+        self.set_grammar(name, grammar, limit)
+        return grammar
+
+
+    def set_grammar(self, name, grammar, limit=None):
+        # an already built grammar, limit overrides per_grammar_limit for it
+        self.grammars[name] = (grammar, next(self._versions), asyncio.Semaphore(limit if limit is not None else self.per_grammar_limit))
+
+
+    async def match(self, name, x: str):
+        # raises KeyError for a grammar that was never added
+        grammar, version, limit = self.grammars[name]
+        key = (name, version, x)
+        self.stats["requests"] += 1
+        result = self.cache.get(key, _MISSING)
+        if result is not _MISSING:
+            self.stats["cache_hits"] += 1
+            return result
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(key, grammar, limit, x))
+            # an error nobody waits for any more is not reported as never retrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._in_flight[key] = task
+        else:
+            self.stats["coalesced"] += 1
+        # a cancelled request leaves the shared computation running for the others
+        return await asyncio.shield(task)
+
+
+    async def match_many(self, name, strings):
+        return await asyncio.gather(*(self.match(name, x) for x in strings))
+
+
+    async def _compute(self, key, grammar, limit, x):
+        try:
+            async with limit:
+                result = await asyncio.get_running_loop().run_in_executor(self.executor, grammar.match, x)
+            if not isinstance(result, bool) and result is not UNKNOWN:
+                # a NumPy bool from a table lookup
+                result = bool(result)
+            self.cache.put(key, result)
+            self.stats["computed"] += 1
+            return result
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            del self._in_flight[key]
+
+
+    def close(self):
+        if self._owned:
+            self.executor.shutdown(wait=True)
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+def encode_result(result):
+    return "UNKNOWN" if result is UNKNOWN else bool(result)
+
+
+def decode_result(value):
+    return UNKNOWN if value == "UNKNOWN" else value
+
+
+async def serve(service: Match_Service, host="127.0.0.1", port=0):
+    # returns the started asyncio server, port=0 picks a free port (server.sockets[0].getsockname()[1])
+
+    async def respond(request, writer):
+        try:
+            result = await service.match(request["grammar"], request["input"])
+            response = {"id": request.get("id"), "result": encode_result(result)}
+        except KeyError as e:
+            response = {"id": request.get("id"), "error": "unknown grammar {}".format(e)}
+        except Exception as e:
+            response = {"id": request.get("id"), "error": "{}: {}".format(type(e).__name__, e)}
+        writer.write((json.dumps(response) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    async def handle(reader, writer):
+        # requests of one connection are answered as they complete, not in order
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    writer.write((json.dumps({"id": None, "error": "malformed request"}) + "\n").encode("utf-8"))
+                    continue
+                task = asyncio.ensure_future(respond(request, writer))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+class Match_Client:
+    # one connection, many requests in flight, responses are matched to requests by id
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._ids = itertools.count()
+        self._waiting = {}
+        self._receiver = asyncio.ensure_future(self._receive())
+
+
+    @classmethod
+    async def connect(cls, host, port):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+
+    async def match(self, grammar, x: str):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        self.writer.write((json.dumps({"id": request_id, "grammar": grammar, "input": x}) + "\n").encode("utf-8"))
+        await self.writer.drain()
+        return await future
+
+
+    async def _receive(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._waiting.pop(response["id"], None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(RuntimeError(response["error"]))
+                else:
+                    future.set_result(decode_result(response["result"]))
+        finally:
+            for future in self._waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            self._waiting.clear()
+
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self._receiver
@@ -0,0 +1,39 @@
+"""
+    All-spans search: every substring derived from a nonterminal, read off one chart
+
+    cells[i, j] is True if the nonterminal derives x[i..j], spans are yielded as (i, j + 1) so that x[i:j + 1] matches.
+    overlapping=False picks leftmost spans and continues after them, the longest if longest=True, otherwise the shortest.
+"""
+
+import numpy as np
+
+
+def iter_spans(cells, longest=False, overlapping=True):
+    L = len(cells)
+    i = 0
+    while i < L:
+        ends = np.flatnonzero(cells[i, i:]) + i
+        if len(ends) == 0:
+            i += 1
+            continue
+        if not overlapping:
+            j = int(ends[-1] if longest else ends[0])
+            yield i, j + 1
+            i = j + 1
+            continue
+        if longest:
+            yield i, int(ends[-1]) + 1
+        else:
+            for j in ends.tolist():
+                yield i, j + 1
+        i += 1
+
+
+def resolve_nonterminal(grammar, nonterminal):
+    # index of a nonterminal of the input grammar in the chart, following merges of the optimizer
+    if nonterminal is None:
+        nonterminal = grammar.S
+    nonterminal = grammar.size_report.get("merged", {}).get(nonterminal, nonterminal)
+    if nonterminal not in grammar.nt_to_index:
+        raise ValueError("{} is not a nonterminal of the optimized grammar, build it with optimize=False to search for it".format(nonterminal))
+    return grammar.nt_to_index[nonterminal]
@@ -0,0 +1,130 @@
+"""
+    Opt-in statistics of match calls
+
+    Set grammar.stats_hooks to a sequence of callables, each is called with the Match_Stats of every match call.
+    With no hooks (the default) match creates no stats and the counters are never touched.
+
+    early_exit: why matching stopped before recognition ("prefilter", "dead_state" for a regular grammar), or None
+    cells_filled: (span, nonterminal) entries set in the chart at the end, items for Earley
+    rules_tried: rule checks, per binary rule and split point whose left part is derived for CYK (the batched kernels
+        compute every pair, this is read off the chart and counts those that go on to the right part), per rule and span for GCSG,
+        per prediction for Earley, per transition for a regular grammar
+    fit_calls, fit_early_exits: calls of Growing_Context_Sensitive_Grammar.fit and those decided before the table
+    cache_hits, cache_misses: context memo lookups (GCSG), Leo topmost lookups (Earley), visited forms (recursive)
+    forms_explored: sentential forms generated by the recursive search
+    timings: seconds per phase of the call, normalization: seconds per phase of building the grammar (CNF, optimizer, indexes)
+
+    The parallel fill runs in other processes and is not counted, only its timings are.
+"""
+
+import json
+import math
+import time
+
+import numpy as np
+
+
+class Phase_Timer:
+    # seconds between consecutive marks, summed per phase
+
+    def __init__(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+
+    def mark(self, phase):
+        # the time since the previous mark (or the start) goes to phase
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - self._last
+        self._last = now
+
+
+class Match_Stats(Phase_Timer):
+
+    FIELDS = ("kind", "engine", "length", "result", "early_exit", "cells_filled", "rules_tried", "fit_calls", "fit_early_exits",
+              "cache_hits", "cache_misses", "forms_explored", "timings", "normalization")
+
+    def __init__(self, grammar, x):
+        self.kind = type(grammar).__name__
+        self.engine = getattr(grammar, "engine", None)
+        self.length = len(x)
+        self.result = None
+        self.early_exit = None
+        self.cells_filled = 0
+        self.rules_tried = 0
+        self.fit_calls = 0
+        self.fit_early_exits = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.forms_explored = 0
+        self.normalization = dict(getattr(grammar, "build_timings", {}))
+        Phase_Timer.__init__(self)
+
+
+    def finish(self, grammar, result):
+        # hands the finished stats to every hook, returns result for the caller
+        self.result = result
+        for hook in grammar.stats_hooks:
+            hook(self)
+        return result
+
+
+    def as_dict(self):
+        d = {name: getattr(self, name) for name in self.FIELDS}
+        # a table entry is a NumPy bool, UNKNOWN of the recursive search is exported by name
+        if isinstance(self.result, (bool, np.bool_)):
+            d["result"] = bool(self.result)
+        elif self.result is not None:
+            d["result"] = repr(self.result)
+        return d
+
+
+    def __repr__(self):
+        return "Match_Stats({})".format(", ".join("{}={!r}".format(k, v) for k, v in self.as_dict().items()))
+
+
+def percentiles(values, qs=(50, 90, 99)):
+    # nearest-rank percentiles of a list of numbers, {q: value}, empty if there are no values
+    ordered = sorted(values)
+    if len(ordered) == 0:
+        return {}
+    return {q: ordered[min(len(ordered) - 1, max(0, math.ceil(q / 100 * len(ordered)) - 1))] for q in qs}
+
+
+class Stats_Collector:
+    # keeps the stats of every call and sums the counters, a hook for tests and quick profiling
+
+    COUNTERS = ("cells_filled", "rules_tried", "fit_calls", "fit_early_exits", "cache_hits", "cache_misses", "forms_explored")
+
+    def __init__(self, keep=True):
+        self.keep = keep
+        self.calls = []
+        self.count = 0
+        self.totals = {name: 0 for name in self.COUNTERS}
+        self.timings = {}
+
+    def __call__(self, stats: Match_Stats):
+        self.count += 1
+        for name in self.COUNTERS:
+            self.totals[name] += getattr(stats, name)
+        for phase, seconds in stats.timings.items():
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+        if self.keep:
+            self.calls.append(stats)
+
+
+class JSON_Lines_Exporter:
+    # one JSON object per call, for a metrics pipeline that tails a file or reads a stream
+
+    def __init__(self, file):
+        # a path (opened for appending) or a writable text stream
+        self._owned = isinstance(file, str)
+        self.file = open(file, "a") if self._owned else file
+
+    def __call__(self, stats: Match_Stats):
+        self.file.write(json.dumps(stats.as_dict()) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self._owned:
+            self.file.close()
@@ -6,16 +6,30 @@
     UNIT: Eliminate unit rules    
 """
 
+from itertools import chain
+
+
+class Letter_Pool:
+    # fresh letters that are neither nonterminals nor terminals, in a fixed order:
+    # the latin letters first, then the private use areas, so conversions are reproducible
+
+    def __init__(self, non_terminal_set, terminal_set):
+        self.used = set(non_terminal_set) | set(terminal_set)
+        self._candidates = chain(
+            "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz",
+            map(chr, chain(range(0xE000, 0xF900), range(0xF0000, 0xFFFFE), range(0x100000, 0x10FFFE))),
+        )
+
+    def take(self):
+        for letter in self._candidates:
+            if letter not in self.used:
+                self.used.add(letter)
+                return letter
+        raise ValueError("no free letter left")
+
+
 def get_next_free_letter(non_terminal_set, terminal_set):
-    # consider used letters
-    for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz":
-        if letter not in non_terminal_set and letter not in terminal_set:
-            return letter
-    # generate random unicode
-    while True:
-        letter = chr(np.random.randint(0, 0x10FFFF))
-        if letter not in non_terminal_set and letter not in terminal_set:
-            return letter
+    return Letter_Pool(non_terminal_set, terminal_set).take()
 
 
 def TERM(non_terminal_set, terminal_set, start_symbol, rules: dict):
@@ -23,9 +37,12 @@ def TERM(non_terminal_set, terminal_set, start_symbol, rules: dict):
     #     with a terminal symbol a being not the only symbol on the right-hand side, introduce, for every such terminal, a new nonterminal symbol Na, and a new rule
     #     Na → a.
     #     Change every rule A → X1 ... a ... Xn to A → X1 ... Na ... Xn.
+    #     One Na is shared by every occurrence of a.
 
     new_non_terminal_set = set()
     new_non_terminal_set.update(non_terminal_set)
+    pool = Letter_Pool(non_terminal_set, terminal_set)
+    proxies = {}
 
     new_rules = {}
     for nt, productions in rules.items():
@@ -34,14 +51,17 @@ def TERM(non_terminal_set, terminal_set, start_symbol, rules: dict):
             new_prod = ""
             for p in prod:
                 if p in terminal_set and len(prod) > 1:
-                    new_nt = get_next_free_letter(new_non_terminal_set, terminal_set)
-                    new_non_terminal_set.add(new_nt)
-                    new_rules[new_nt] = [p]
-                    new_prod += new_nt
+                    if p not in proxies:
+                        proxies[p] = pool.take()
+                        new_non_terminal_set.add(proxies[p])
+                    new_prod += proxies[p]
                 else:
                     new_prod += p
             new_rules[nt].append(new_prod)
 
+    for p, new_nt in proxies.items():
+        new_rules[new_nt] = [p]
+
     return new_non_terminal_set, terminal_set, start_symbol, new_rules
 
 
@@ -53,22 +73,27 @@ def BIN(non_terminal_set, terminal_set, start_symbol, rules: dict):
     # ... ,
     # An-2 → Xn-1 Xn,
     # where A1,...,An-1 are new nonterminal symbols.
+    # Rules ending with the same symbols share the same chain.
     new_non_terminal_set = set()
     new_non_terminal_set.update(non_terminal_set)
+    pool = Letter_Pool(non_terminal_set, terminal_set)
     new_rules = {}
+    chains = {}
+
+    def chain_of(symbols):
+        # the new nonterminal deriving exactly symbols, len(symbols) >= 2
+        if symbols not in chains:
+            A = pool.take()
+            new_non_terminal_set.add(A)
+            chains[symbols] = A
+            new_rules[A] = [symbols if len(symbols) == 2 else symbols[0] + chain_of(symbols[1:])]
+        return chains[symbols]
+
     for nt, productions in rules.items():
         new_rules[nt] = []
         for prod in productions:
             if len(prod) > 2:
-                A = get_next_free_letter(new_non_terminal_set, terminal_set)
-                new_non_terminal_set.add(A)
-                new_rules[nt].append(prod[0] + A)
-                for i in range(1, len(prod) - 2):
-                    A_ = get_next_free_letter(new_non_terminal_set, terminal_set)
-                    new_non_terminal_set.add(A_)
-                    new_rules[A] = [prod[i] + A_]
-                    A = A_
-                new_rules[A] = [prod[-2] + prod[-1]]
+                new_rules[nt].append(prod[0] + chain_of(prod[1:]))
             else:
                 new_rules[nt].append(prod)
             
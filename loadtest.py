@@ -0,0 +1,119 @@
+"""
+    Load test of the asyncio matching service
+
+    Starts grammars.service behind the local JSON lines server in this process, then many concurrent clients send requests
+    drawn with a skew from a pool of inputs, so that popular inputs repeat and exercise the cache and the coalescing.
+    Prints the p50, p90 and p99 latency, the throughput and the service counters.
+
+    python loadtest.py --clients 64 --requests 5000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmark import dyck_grammar, dyck_inputs, gcsg_grammar, gcsg_inputs, regular_grammar, regular_inputs
+from grammars.service import Match_Service, Match_Client, serve
+from grammars.stats import percentiles
+
+
+# name -> (grammar builder, inputs builder, lengths)
+WORKLOADS = {
+    "dyck": (lambda: dyck_grammar(4), lambda n, rng: dyck_inputs(4, n, rng), [9, 17, 33, 65]),
+    "gcsg": (lambda: gcsg_grammar(2), lambda n, rng: gcsg_inputs(2, n, rng), [9, 13, 17]),
+    "regular": (lambda: regular_grammar(4), lambda n, rng: regular_inputs(4, n, rng), [100, 1000, 10000]),
+}
+
+
+def input_pool(distinct, rng):
+    # (grammar, input) pairs, members and non members of every length
+    pool = []
+    while len(pool) < distinct:
+        for name, (_, inputs, lengths) in WORKLOADS.items():
+            n = rng.choice(lengths)
+            pool.extend((name, x) for x in inputs(n, rng))
+    return pool[:distinct]
+
+
+async def run(clients=32, requests=2000, distinct=200, skew=1.2, workers=4, limit=2, cache_size=10000, ttl=300.0, transport="tcp", seed=0):
+    rng = random.Random(seed)
+    pool = input_pool(distinct, rng)
+    # Zipf-like weights, the first inputs of the pool are the popular ones
+    weights = [1 / (rank + 1) ** skew for rank in range(len(pool))]
+    plan = rng.choices(pool, weights=weights, k=requests)
+
+    service = Match_Service(workers=workers, per_grammar_limit=limit, cache_size=cache_size, ttl=ttl)
+    for name, (grammar, _, _) in WORKLOADS.items():
+        await service.add_grammar(name, *grammar()[:4])
+
+    server = None
+    if transport == "tcp":
+        server = await serve(service)
+        port = server.sockets[0].getsockname()[1]
+        connections = [await Match_Client.connect("127.0.0.1", port) for _ in range(clients)]
+        calls = [connection.match for connection in connections]
+    else:
+        connections = []
+        calls = [service.match] * clients
+
+    latencies = []
+    queue = list(reversed(plan))
+
+    async def client(call):
+        while queue:
+            name, x = queue.pop()
+            start = time.perf_counter()
+            await call(name, x)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(call) for call in calls))
+    elapsed = time.perf_counter() - start
+
+    for connection in connections:
+        await connection.close()
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+    service.close()
+
+    return {
+        "transport": transport, "clients": clients, "requests": requests, "distinct": distinct, "workers": workers, "limit": limit,
+        "seconds": elapsed, "throughput": requests / elapsed if elapsed > 0 else 0.0,
+        "latency": {"p{}".format(q): seconds for q, seconds in percentiles(latencies, (50, 90, 99)).items()} | {"max": max(latencies)},
+        "service": dict(service.stats, cached=len(service.cache), evicted=service.cache.evicted, expired=service.cache.expired),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test the asyncio matching service")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients, one connection each")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--distinct", type=int, default=200, help="size of the input pool")
+    parser.add_argument("--skew", type=float, default=1.2, help="Zipf exponent of the input popularity, 0 for uniform")
+    parser.add_argument("--workers", type=int, default=4, help="executor threads")
+    parser.add_argument("--limit", type=int, default=2, help="concurrent match calls per grammar")
+    parser.add_argument("--cache-size", type=int, default=10000, help="0 disables the result cache")
+    parser.add_argument("--ttl", type=float, default=300.0)
+    parser.add_argument("--transport", choices=["tcp", "inproc"], default="tcp", help="through the local server or direct calls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(clients=args.clients, requests=args.requests, distinct=args.distinct, skew=args.skew, workers=args.workers,
+                             limit=args.limit, cache_size=args.cache_size, ttl=args.ttl, transport=args.transport, seed=args.seed))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    latency = report["latency"]
+    print("{} requests from {} clients over {} in {:.3f}s, {:.1f} requests/s".format(
+        report["requests"], report["clients"], report["transport"], report["seconds"], report["throughput"]))
+    print("latency p50 {:.3f}ms  p90 {:.3f}ms  p99 {:.3f}ms  max {:.3f}ms".format(
+        latency["p50"] * 1e3, latency["p90"] * 1e3, latency["p99"] * 1e3, latency["max"] * 1e3))
+    print("service " + ", ".join("{} {}".format(k, v) for k, v in report["service"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,32 @@
+"""
+    Bulk membership checks over a newline-delimited corpus, or the self test with no arguments
+
+    python main.py --grammar grammar.json --corpus corpus.txt --output results.tsv [--workers 8] [--resume]
+
+    The grammar is a compiled grammar file (.gcsg) or JSON {"non_terminals": [...], "terminals": [...], "start_symbol": "S", "rules": {lhs: [rhs, ...]}}.
+    The corpus is mapped with mmap and read record by record, it is never loaded as a whole.
+    Every record gives one output line "<byte offset>\t<True|False|UNKNOWN>", written in corpus order as chunks complete,
+    so an interrupted run continues after the last written record with --resume.
+"""
+
+import argparse
+import itertools
+import json
+import mmap
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import grammars
+from grammars.batch import WORKER_OPTIONS
+from grammars.compiled import MAGIC
+from grammars.stats import percentiles
 
 
-if __name__ == "__main__":
+def self_test():
 
     # context free grammar
     grammar_1 = grammars.build_grammar({"S", "A"}, {"a", "b"}, "S", {
@@ -39,6 +64,13 @@ if __name__ == "__main__":
     assert grammar_3.match("aabbb") == True
     assert grammar_3.match("bb") == False
 
+    # match statistics count the rule checks a string needs, not a bound fixed by its length
+    tried = []
+    grammar_3.stats_hooks = [lambda stats: tried.append(stats.rules_tried)]
+    assert grammar_3.match("aabbb") == True and grammar_3.match("abbab") == False
+    grammar_3.stats_hooks = ()
+    assert tried[0] != tried[1]
+
 
     # unrestricted grammar not context free nor growing context sensitive nor context sensitive, may never halt
     grammar_4 = grammars.build_grammar({"S", "A"}, {"a", "b"}, "S", {
@@ -65,3 +97,368 @@ if __name__ == "__main__":
     assert grammar_5.match("aaabbb") == True
     assert grammar_5.match("aabbbbbbbbbbbbbbcb") == True
     assert grammar_5.match("ccccaaaaabbbbbb") == False
+
+    # match returns a bool whether or not statistics are collected
+    assert type(grammar_5.match("aaabbb")) is bool
+    grammar_5.stats_hooks = [lambda stats: None]
+    assert type(grammar_5.match("aaabbb")) is bool
+    grammar_5.stats_hooks = ()
+
+
+    # the worker count never changes the answer, parallel filling only runs the worklist fixpoint
+    for rules, x in [({"S": ["AB"], "AB": ["aaB"], "B": ["bb"]}, "aabb"), ({"S": ["AC"], "AC": ["aaC"], "C": ["bbb"]}, "aabbb")]:
+        for engine in ["pass", "worklist"]:
+            serial = grammars.Growing_Context_Sensitive_Grammar({"S", "A", "B", "C"}, {"a", "b"}, "S", rules, engine=engine)
+            parallel = grammars.Growing_Context_Sensitive_Grammar({"S", "A", "B", "C"}, {"a", "b"}, "S", rules, engine=engine, workers=2, parallel_threshold=0)
+            assert parallel.match(x) == serial.match(x)
+
+
+    # the prefix-incremental recognizer answers as match after every chunk, on every chart
+    for chart in ["dense", "packed", "mmap"]:
+        grammar = grammars.Context_Free_Grammar({"S", "A"}, {"a", "b"}, "S", {"S": ["aSA", "b"], "A": ["b"]}, chart=chart)
+        recognizer = grammar.recognizer()
+        for end, chunk in [(1, "a"), (3, "ab"), (4, "b"), (6, "bb")]:
+            assert recognizer.feed(chunk).accepts() == grammar.match("aabbbb"[:end])
+    grammar = grammars.Growing_Context_Sensitive_Grammar({"S", "A", "B"}, {"a", "b"}, "S", {"S": ["AB"], "AB": ["aaB"], "B": ["bb"]}, engine="worklist")
+    recognizer = grammar.recognizer()
+    for end, chunk in [(1, "a"), (2, "a"), (3, "b"), (4, "b"), (5, "b")]:
+        assert recognizer.feed(chunk).accepts() == grammar.match("aabbb"[:end])
+    try:
+        grammars.Growing_Context_Sensitive_Grammar({"S", "A", "B"}, {"a", "b"}, "S", {"S": ["AB"], "AB": ["aaB"], "B": ["bb"]}).recognizer()
+        assert False
+    except ValueError:
+        pass
+
+
+    # the generated engine answers as the pass engine, also when the split of a rule leaves no nonterminal to generate code for
+    for rules in [{"S": ["SaS", "b"]}, {"S": ["aS", "b"]}]:
+        generated = grammars.Growing_Context_Sensitive_Grammar({"S"}, {"a", "b"}, "S", rules, engine="generated")
+        default = grammars.Growing_Context_Sensitive_Grammar({"S"}, {"a", "b"}, "S", rules)
+        for x in ["b", "ab", "bab", "aab", "ba"]:
+            assert generated.match(x) == default.match(x)
+
+    # a compiled grammar holds no code, the generated engine makes its source again from the loaded rules
+    compiled = grammar_5.compile()
+    assert "generated_source" not in compiled.meta
+    loaded = grammars.Growing_Context_Sensitive_Grammar.from_compiled(compiled, engine="generated")
+    assert loaded.generated_source() == grammars.Growing_Context_Sensitive_Grammar.from_compiled(compiled).generated_source()
+    assert loaded.match("aabbbbbbbbbbbbbbcb") == True
+
+
+    # every engine and option answers as the default engine on the grammars above
+    def strings(alphabet, n):
+        return ["".join(w) for k in range(1, n + 1) for w in itertools.product(sorted(alphabet), repeat=k)]
+
+    def round_trip(grammar):
+        # through a compiled file, the engine is a matching option and not part of it
+        fd, path = tempfile.mkstemp(suffix=".gcsg")
+        os.close(fd)
+        try:
+            grammar.compile().save(path)
+            loaded = grammars.load_grammar(path)
+        finally:
+            os.remove(path)
+        if hasattr(grammar, "engine"):
+            loaded.engine = grammar.engine
+        return loaded
+
+    def check_options(grammar, variants, xs, recognizers=(), substrings=False):
+        # variants are built without the prefilter, which must never reject a member
+        expected = {x: grammar.match(x) for x in xs}
+        for variant in variants:
+            variant.prefilter = None
+            assert all(variant.match(x) == expected[x] for x in xs), variant.engine
+        assert list(round_trip(grammar).match_many(xs)) == [expected[x] for x in xs]
+        assert list(grammar.match_many(xs, workers=2)) == [expected[x] for x in xs]
+        for recognizer in recognizers:
+            for x in xs[-3:]:
+                r = recognizer()
+                assert all(r.feed(c).accepts() == grammar.match(x[:end + 1]) for end, c in enumerate(x))
+        for x in xs:
+            spans = grammar.find_all(x)
+            assert ((0, len(x)) in spans) == expected[x]
+            if substrings:
+                # a context free span does not depend on the text around it
+                assert set(spans) == {(i, j) for i in range(len(x)) for j in range(i + 1, len(x) + 1) if expected[x[i:j]]}
+            assert (grammar.parse(x) is None) == (not expected[x])
+
+    for grammar, n in [(grammar_1, 8), (grammar_3, 7)]:
+        compiled = grammar.compile()
+        variants = [grammars.Context_Free_Grammar.from_compiled(compiled, engine=engine) for engine in ["naive", "earley", "generated"]]
+        variants += [grammars.Context_Free_Grammar.from_compiled(compiled, chart=chart) for chart in ["packed", "mmap"]]
+        variants.append(grammars.Context_Free_Grammar.from_compiled(compiled, workers=2, parallel_threshold=0))
+        recognizers = [grammars.Context_Free_Grammar.from_compiled(compiled, chart=chart).recognizer for chart in ["dense", "packed", "mmap"]]
+        xs = strings(grammar.terminal_set, n)
+        # one parallel fill per input starts processes, the longest inputs are enough
+        check_options(grammar, variants[:-1], xs, recognizers, substrings=True)
+        check_options(grammar, variants[-1:], xs[-4:])
+
+    for grammar, tested in [(grammar_2, ["aabbc", "aaabbbc", "aaaaaaccc"]), (grammar_5, ["aa", "aaabbb", "aabbbbbbbbbbbbbbcb", "ccccaaaaabbbbbb"])]:
+        compiled = grammar.compile()
+        xs = strings(grammar.terminal_set, 5) + tested
+        variants = [grammars.Growing_Context_Sensitive_Grammar.from_compiled(compiled, chart=chart) for chart in ["packed", "mmap"]]
+        variants.append(grammars.Growing_Context_Sensitive_Grammar.from_compiled(compiled, engine="generated"))
+        check_options(grammar, variants, xs)
+        # the worklist fixpoint may accept more than the single pass, its options are compared with it
+        worklist = grammars.Growing_Context_Sensitive_Grammar.from_compiled(compiled, engine="worklist")
+        variants = [grammars.Growing_Context_Sensitive_Grammar.from_compiled(compiled, engine="worklist", chart="packed")]
+        check_options(worklist, variants, xs, [worklist.recognizer])
+        check_options(worklist, [grammars.Growing_Context_Sensitive_Grammar.from_compiled(compiled, engine="worklist", workers=2, parallel_threshold=0)], tested)
+
+    assert [round_trip(grammar_4).match(x) for x in ["b", "ab", "aaab", "bbbb"]] == [True] * 4
+
+
+    # the optimizer merges A and B, the forests still hold the derivations of the input grammar
+    for grammar_class in [grammars.Context_Free_Grammar, grammars.Growing_Context_Sensitive_Grammar]:
+        grammar = grammar_class({"S", "A", "B"}, {"a"}, "S", {"S": ["AB", "BA"], "A": ["a"], "B": ["a"]})
+        assert grammar.size_report["merged"] == {"B": "A"}
+        forest = grammar.parse("aa")
+        assert forest.count() == 2
+        assert sorted(forest.trees()) == [("S", ("A", "a"), ("B", "a")), ("S", ("B", "a"), ("A", "a"))]
+
+
+    # a regular grammar matches with its DFA, spans and forests come from CYK, a context free engine asked for is kept
+    regular = grammars.build_grammar({"S"}, {"a", "b"}, "S", {"S": ["aS", "b"]})
+    assert isinstance(regular, grammars.Regular_Grammar)
+    assert regular.find_all("abab") == [(0, 2), (1, 2), (2, 4), (3, 4)]
+    assert list(regular.parse("ab").trees()) == [("S", "a", ("S", "b"))]
+    earley = grammars.build_grammar({"S"}, {"a", "b"}, "S", {"S": ["aS", "b"]}, context_free_engine="earley")
+    assert isinstance(earley, grammars.Context_Free_Grammar) and earley.engine == "earley"
+    assert [earley.match(x) for x in ["b", "aab", "aba"]] == [regular.match(x) for x in ["b", "aab", "aba"]] == [True, True, False]
+
+
+def load_grammar_file(path, cache_dir=None, engine=None, max_steps=None, max_seconds=None):
+    # a compiled grammar or a JSON grammar, options that a grammar does not have are left out
+    with open(path, "rb") as f:
+        compiled = f.read(len(MAGIC)) == MAGIC
+    if compiled:
+        grammar = grammars.load_grammar(path)
+    else:
+        with open(path, encoding="utf-8") as f:
+            spec = json.load(f)
+        # a context free engine asked for also applies to a regular grammar, which would otherwise get the DFA
+        context_free_engine = engine if engine in ("vectorized", "naive", "earley", "generated") else None
+        grammar = grammars.build_grammar(set(spec["non_terminals"]), set(spec["terminals"]), spec["start_symbol"], spec["rules"], cache_dir=cache_dir,
+                                         context_free_engine=context_free_engine)
+    for name, value in (("engine", engine), ("max_steps", max_steps), ("max_seconds", max_seconds)):
+        if value is not None and hasattr(grammar, name):
+            setattr(grammar, name, value)
+    return grammar
+
+
+def record_start(corpus, offset):
+    # the first record starting at or after offset
+    if offset <= 0:
+        return 0
+    newline = corpus.find(b"\n", offset - 1)
+    return len(corpus) if newline < 0 else newline + 1
+
+
+def chunk_bounds(corpus, start, chunk_bytes):
+    # byte ranges of about chunk_bytes, every range starts at a record
+    size = len(corpus)
+    while start < size:
+        end = record_start(corpus, start + chunk_bytes)
+        yield start, end
+        start = end
+
+
+def check_range(grammar, corpus, start, end, limit=None):
+    # (offset, result) of every record starting in [start, end), at most limit of them, and the seconds of every match
+    results = []
+    latencies = []
+    pos = start
+    while pos < end and (limit is None or len(results) < limit):
+        newline = corpus.find(b"\n", pos, end)
+        stop = end if newline < 0 else newline
+        x = corpus[pos:stop].rstrip(b"\r").decode("utf-8")
+        begin = time.perf_counter()
+        result = grammar.match(x)
+        latencies.append(time.perf_counter() - begin)
+        results.append((pos, "UNKNOWN" if result is grammars.UNKNOWN else str(bool(result))))
+        pos = stop + 1
+    return results, latencies
+
+
+_worker = None
+
+
+def _init_worker(grammar_path, corpus_path, options):
+    global _worker
+    grammar = grammars.load_grammar(grammar_path)
+    for name, value in options.items():
+        setattr(grammar, name, value)
+    with open(corpus_path, "rb") as f:
+        _worker = (grammar, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _check_chunk(bounds):
+    grammar, corpus = _worker
+    return check_range(grammar, corpus, *bounds)
+
+
+class Reservoir:
+    # uniform sample of at most size latencies, percentiles of a multi-GB run stay in bounded memory
+
+    def __init__(self, size=100000, seed=0):
+        self.size = size
+        self.seen = 0
+        self.sample = []
+        self.rng = random.Random(seed)
+
+    def extend(self, values):
+        for value in values:
+            self.seen += 1
+            if len(self.sample) < self.size:
+                self.sample.append(value)
+            else:
+                k = self.rng.randrange(self.seen)
+                if k < self.size:
+                    self.sample[k] = value
+
+
+def resume_offset(output_path):
+    # offset of the last record in the output, a partial last line of an interrupted run is cut off; None if there is none
+    if not os.path.exists(output_path):
+        return None
+    with open(output_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""
+        # read back until two newlines, or the start of the file, frame the last complete line
+        while end > 0 and tail.count(b"\n") < 2:
+            begin = max(0, end - 4096)
+            f.seek(begin)
+            tail = f.read(end - begin) + tail
+            end = begin
+        complete = tail.rfind(b"\n") + 1
+        f.truncate(end + complete)
+    lines = tail[:complete].split(b"\n")
+    return int(lines[-2].split(b"\t", 1)[0]) if len(lines) >= 2 else None
+
+
+def run(grammar_path, corpus_path, output_path, workers=1, chunk_bytes=1 << 20, start_offset=0, resume=False, max_records=None,
+        cache_dir=None, engine=None, max_steps=None, max_seconds=None, progress=False, log=print):
+    with open(corpus_path, "rb") as f:
+        corpus = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(corpus_path) > 0 else b""
+
+    start = record_start(corpus, start_offset)
+    mode = "w"
+    if resume:
+        last = resume_offset(output_path)
+        if last is not None:
+            start = max(start, record_start(corpus, last + 1))
+        mode = "a"
+
+    grammar = load_grammar_file(grammar_path, cache_dir=cache_dir, engine=engine, max_steps=max_steps, max_seconds=max_seconds)
+
+    reservoir = Reservoir()
+    records = 0
+    processed_bytes = 0
+    began = time.perf_counter()
+    bounds = chunk_bounds(corpus, start, chunk_bytes)
+
+    with open(output_path, mode, encoding="utf-8") as out:
+
+        def write(results, latencies):
+            nonlocal records, processed_bytes
+            if max_records is not None:
+                results = results[:max_records - records]
+                latencies = latencies[:len(results)]
+            out.write("".join("{}\t{}\n".format(offset, result) for offset, result in results))
+            out.flush()
+            records += len(results)
+            if results:
+                last = results[-1][0]
+                processed_bytes = record_start(corpus, last + 1) - start
+            reservoir.extend(latencies)
+            if progress:
+                elapsed = time.perf_counter() - began
+                log("{} records, {:.1f} MB, {:.1f} records/s".format(records, processed_bytes / 1e6, records / elapsed if elapsed > 0 else 0.0), file=sys.stderr)
+            return max_records is not None and records >= max_records
+
+        if workers <= 1:
+            for chunk in bounds:
+                if write(*check_range(grammar, corpus, *chunk, None if max_records is None else max_records - records)):
+                    break
+        else:
+            # workers map the compiled grammar and the corpus, tasks only carry byte ranges
+            fd, compiled_path = tempfile.mkstemp(suffix=".gcsg")
+            os.close(fd)
+            try:
+                grammar.compile().save(compiled_path)
+                options = {name: getattr(grammar, name) for name in WORKER_OPTIONS if hasattr(grammar, name)}
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(compiled_path, corpus_path, options)) as pool:
+                    # chunks complete in any order but are written in corpus order, at most 2 * workers in flight
+                    pending = []
+                    done = False
+                    for chunk in bounds:
+                        pending.append(pool.submit(_check_chunk, chunk))
+                        if len(pending) >= 2 * workers:
+                            done = write(*pending.pop(0).result())
+                            if done:
+                                break
+                    while pending and not done:
+                        done = write(*pending.pop(0).result())
+                    for future in pending:
+                        future.cancel()
+            finally:
+                os.remove(compiled_path)
+
+    elapsed = time.perf_counter() - began
+    latency = percentiles(reservoir.sample, (50, 90, 99))
+    report = {
+        "records": records, "bytes": processed_bytes, "seconds": elapsed, "start_offset": start,
+        "records_per_second": records / elapsed if elapsed > 0 else 0.0,
+        "megabytes_per_second": processed_bytes / 1e6 / elapsed if elapsed > 0 else 0.0,
+        "latency": {"p{}".format(q): seconds for q, seconds in latency.items()},
+    }
+    if reservoir.sample:
+        report["latency"]["max"] = max(reservoir.sample)
+    return report
+
+
+def main():
+    if len(sys.argv) == 1:
+        self_test()
+        return
+    parser = argparse.ArgumentParser(description="bulk membership checks of a newline-delimited corpus")
+    parser.add_argument("--self-test", action="store_true", help="run the asserts of the example grammars and exit")
+    parser.add_argument("--grammar", help="compiled grammar (.gcsg) or JSON grammar file")
+    parser.add_argument("--corpus", help="newline-delimited input strings")
+    parser.add_argument("--output", help="results, one line <offset>\\t<result> per record")
+    parser.add_argument("--workers", type=int, default=1, help="processes, each checks whole chunks")
+    parser.add_argument("--chunk-bytes", type=int, default=1 << 20)
+    parser.add_argument("--start-offset", type=int, default=0, help="byte offset in the corpus to start at, rounded up to a record")
+    parser.add_argument("--resume", action="store_true", help="append to the output, after the last record it holds")
+    parser.add_argument("--max-records", type=int, help="stop after this many records")
+    parser.add_argument("--cache-dir", help="compiled grammar cache for JSON grammars")
+    parser.add_argument("--engine", help="matching engine, e.g. vectorized, earley or generated")
+    parser.add_argument("--max-steps", type=int, help="search budget of a recursive grammar")
+    parser.add_argument("--max-seconds", type=float, help="time budget of a recursive grammar per record")
+    parser.add_argument("--progress", action="store_true", help="report progress on stderr after every chunk")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.self_test:
+        self_test()
+        print("self test passed")
+        return
+    if args.grammar is None or args.corpus is None or args.output is None:
+        parser.error("--grammar, --corpus and --output are required")
+
+    report = run(args.grammar, args.corpus, args.output, workers=args.workers, chunk_bytes=args.chunk_bytes, start_offset=args.start_offset,
+                 resume=args.resume, max_records=args.max_records, cache_dir=args.cache_dir, engine=args.engine,
+                 max_steps=args.max_steps, max_seconds=args.max_seconds, progress=args.progress)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    latency = report["latency"]
+    print("{} records, {:.1f} MB in {:.3f}s: {:.1f} records/s, {:.2f} MB/s".format(
+        report["records"], report["bytes"] / 1e6, report["seconds"], report["records_per_second"], report["megabytes_per_second"]))
+    if latency:
+        print("latency p50 {:.3f}ms  p90 {:.3f}ms  p99 {:.3f}ms  max {:.3f}ms".format(
+            latency["p50"] * 1e3, latency["p90"] * 1e3, latency["p99"] * 1e3, latency["max"] * 1e3))
+
+
+if __name__ == "__main__":
+    main()